@@ -0,0 +1,4 @@
+from .celery_app import celery_app
+from .tasks import generate_content_task, verify_pin_task
+
+__all__ = ["celery_app", "generate_content_task", "verify_pin_task"]
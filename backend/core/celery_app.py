@@ -0,0 +1,24 @@
+from celery import Celery
+
+from utils.config import REDIS_URL, WORKER_CONCURRENCY
+
+celery_app = Celery(
+    "brainrotify",
+    broker=REDIS_URL,
+    backend=REDIS_URL,
+    include=["core.tasks"],
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    # Report STARTED so the status endpoint can tell queued jobs from running ones
+    task_track_started=True,
+    # Generation takes minutes, so never let a worker hoard queued jobs
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    # Whisper's thread count is derived from this, so set it here rather than with --concurrency
+    worker_concurrency=WORKER_CONCURRENCY,
+    result_expires=60 * 60 * 24,
+)
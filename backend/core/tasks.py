@@ -0,0 +1,119 @@
+import asyncio
+import functools
+
+import httpx
+import redis
+from celery.signals import worker_process_shutdown
+from celery.utils.log import get_task_logger
+
+from .celery_app import celery_app
+
+logger = get_task_logger(__name__)
+
+# Errors worth re-running a job for: network failures and timeouts talking to
+# Venice/Pinata (after the HTTP clients' own retries) or Redis. Anything else,
+# such as bad input or an API rejecting the request, fails the job right away.
+TRANSIENT_ERRORS = (httpx.TransportError, redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+
+def _is_transient(exc):
+    """Whether `exc`, or an error it was raised from, is a TRANSIENT_ERRORS failure.
+    
+    The services wrap client errors in plain Exceptions, so the chain is walked.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, TRANSIENT_ERRORS):
+            return True
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+# Celery tasks are synchronous, so each worker process drives the async
+# pipeline on a single long-lived event loop instead of one per task. It is
+# created lazily so that forked worker processes never share a loop.
+@functools.lru_cache(maxsize=1)
+def _get_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+# The generation service (and the HTTP clients and Whisper model it holds)
+# is built once per worker process and reused by every task.
+@functools.lru_cache(maxsize=1)
+def get_generation_service():
+    # Imported here so the API process, which only queues tasks, never loads
+    # the video stack (moviepy, Whisper)
+    from services import GenerationService
+
+    # The loop must exist before the service so its asyncio primitives bind to it
+    _get_loop()
+    return GenerationService(ipfs_service=get_ipfs_service())
+
+
+# Pin verification only needs the IPFS client, so it gets its own accessor
+# that leaves the rest of the pipeline (and Whisper) unloaded.
+@functools.lru_cache(maxsize=1)
+def get_ipfs_service():
+    from services import IPFSService
+
+    _get_loop()
+    return IPFSService()
+
+
+@worker_process_shutdown.connect
+def _close_generation_service(**kwargs):
+    if get_generation_service.cache_info().currsize:
+        # Also closes the shared IPFS service
+        _get_loop().run_until_complete(get_generation_service().aclose())
+    elif get_ipfs_service.cache_info().currsize:
+        _get_loop().run_until_complete(get_ipfs_service().aclose())
+
+
+@celery_app.task(bind=True, max_retries=3, default_retry_delay=30)
+def generate_content_task(self, content, style, duration=60, ticker=None, description=None):
+    """Run the full generation pipeline for a queued /generate request.
+
+    Progress is reported through the PROGRESS state with the current pipeline
+    step in the task meta, so clients can poll GET /generate/{job_id}.
+    """
+    def on_step(step):
+        self.update_state(state="PROGRESS", meta={"step": step})
+
+    try:
+        logger.info(f"Generating content for topic: {content}, style: {style}, ticker: {ticker}")
+        generation_service = get_generation_service()
+        result = _get_loop().run_until_complete(generation_service.generate_content(
+            content=content,
+            style=style,
+            duration=duration,
+            ticker=ticker,
+            description=description,
+            on_step=on_step
+        ))
+        logger.info(f"Successfully generated content. Metadata URI: {result['metadata_uri']}")
+        
+        # Pin confirmation is off the critical path: the job result only needs the URIs
+        for uri in (result["video_uri"], result.get("thumbnail_uri")):
+            if uri:
+                verify_pin_task.delay(uri)
+        
+        return result
+    except Exception as e:
+        logger.error(f"Error generating content: {str(e)}", exc_info=True)
+        if _is_transient(e):
+            raise self.retry(exc=e)
+        raise
+
+
+@celery_app.task(bind=True, max_retries=5, default_retry_delay=10)
+def verify_pin_task(self, uri):
+    """Confirm in the background that an uploaded file is served by the IPFS gateway."""
+    ipfs_service = get_ipfs_service()
+    pinned = _get_loop().run_until_complete(ipfs_service.verify_pin(uri))
+    
+    if not pinned:
+        raise self.retry()
+    return pinned
@@ -1,9 +1,21 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import logging, time
+from fastapi.responses import ORJSONResponse
+from celery.result import AsyncResult
+from contextlib import asynccontextmanager
+import asyncio, hashlib, logging, os, time
+import httpx
+import redis.asyncio as redis
 
-from services import GenerationService
-from models import GenerateRequest, GenerateResponse, ErrorResponse
+from core import celery_app, generate_content_task
+from utils import REDIS_URL
+from models import (
+    GenerateRequest,
+    GenerateResponse,
+    GenerateJobResponse,
+    GenerateStatusResponse,
+    ErrorResponse,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -12,25 +24,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Health responses are constant, so they are served as pre-encoded bytes
+_STATIC_OK_BYTES = b'{"status":"ok"}'
+_STATIC_OK_ETAG = f'"{hashlib.blake2b(_STATIC_OK_BYTES, digest_size=8).hexdigest()}"'
+
+# Downstream services checked by /ready; any HTTP response means reachable
+READY_CHECK_URLS = {
+    "venice": "https://api.venice.ai/api/v1/models",
+    "ipfs": "https://api.pinata.cloud",
+}
+READY_CACHE_SECONDS = 5.0
+_ready_cache = {"checked_at": float("-inf"), "ok": False, "checks": {}}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.health_client = httpx.AsyncClient(timeout=2.0)
+    app.state.redis = redis.from_url(REDIS_URL)
+    yield
+    await app.state.health_client.aclose()
+    await app.state.redis.aclose()
+
+
 app = FastAPI(
     title="Brainrotify API",
     description="API for generating brainrot content videos",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
-# Add CORS middleware to allow requests from frontend
+# Add CORS middleware to allow requests from frontend. The API is public and
+# the frontend sends no cookies, so credentials stay off and the wildcard
+# origin can be answered without echoing each request's Origin back.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # In production, you would restrict this
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_credentials=False,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
 )
 
-# Dependency to get the generation service
-def get_generation_service():
-    return GenerationService()
-
 
 @app.get("/")
 async def root():
@@ -39,58 +73,139 @@ async def root():
 
 @app.get('/ping')
 async def ping():
-    return {"status": "ok", "time": time.time()}
+    return Response(content=_STATIC_OK_BYTES, media_type="application/json")
+
+
+@app.get("/live")
+async def live(request: Request):
+    """Liveness check: the process is up and serving requests."""
+    headers = {"ETag": _STATIC_OK_ETAG}
+    if request.headers.get("if-none-match") == _STATIC_OK_ETAG:
+        return Response(status_code=304, headers=headers)
+    return Response(content=_STATIC_OK_BYTES, media_type="application/json", headers=headers)
+
+
+async def _check_url(client, url):
+    try:
+        response = await client.head(url)
+        return response.status_code < 500
+    except httpx.HTTPError:
+        return False
+
+
+async def _check_redis(client):
+    try:
+        return bool(await client.ping())
+    except Exception:
+        return False
+
+
+@app.get("/ready")
+async def ready(request: Request):
+    """
+    Readiness check: Redis (the job queue) and the Venice and IPFS APIs are reachable.
+    
+    The result is cached for a few seconds so that frequent probes do not
+    turn into a stream of requests to the downstream services.
+    """
+    now = time.monotonic()
+    if now - _ready_cache["checked_at"] > READY_CACHE_SECONDS:
+        names = ["redis", *READY_CHECK_URLS]
+        results = await asyncio.gather(
+            _check_redis(request.app.state.redis),
+            *(_check_url(request.app.state.health_client, url) for url in READY_CHECK_URLS.values())
+        )
+        _ready_cache["checks"] = dict(zip(names, results))
+        _ready_cache["ok"] = all(results)
+        _ready_cache["checked_at"] = now
+    
+    body = {"status": "ok" if _ready_cache["ok"] else "unavailable", "checks": _ready_cache["checks"]}
+    return ORJSONResponse(body, status_code=200 if _ready_cache["ok"] else 503)
 
 @app.post(
     "/generate", 
-    response_model=GenerateResponse,
+    status_code=202,
+    response_model=GenerateJobResponse,
     responses={
-        200: {"model": GenerateResponse},
+        202: {"model": GenerateJobResponse},
         400: {"model": ErrorResponse},
         500: {"model": ErrorResponse},
     },
 )
-async def generate(
-    request: GenerateRequest, 
-    generation_service: GenerationService = Depends(get_generation_service)
-):
+def generate(request: GenerateRequest):
     """
-    Generate a brainrot video based on the given content and style.
+    Queue the generation of a brainrot video based on the given content and style.
     
-    This endpoint will:
+    The job runs on a Celery worker and will:
     1. Generate a script using Venice AI
     2. Convert the script to speech using TTS
     3. Generate multiple images based on the content and style (1 per 10s of audio)
     4. Combine the images, speech, and subtitles into a video
     5. Upload the video to IPFS
     6. Create and upload metadata to IPFS with ticker symbol and description
-    7. Return the metadata URI
+    7. Store the metadata URI as the job result
     
-    The frontend can then use this metadata URI to mint an NFT.
+    Returns a job ID immediately. The frontend polls GET /generate/{job_id}
+    until the job succeeds and then uses the metadata URI to mint an NFT.
     """
     try:
-        logger.info(f"Generating content for topic: {request.content}, style: {request.style}, ticker: {request.ticker}")
+        logger.info(f"Queueing generation for topic: {request.content}, style: {request.style}, ticker: {request.ticker}")
         
-        result = await generation_service.generate_content(
-            content=request.content, 
-            style=request.style, 
-            duration=request.duration,
-            ticker=request.ticker,
-            description=request.description
+        task = generate_content_task.delay(
+            request.content,
+            request.style,
+            request.duration,
+            request.ticker,
+            request.description
         )
         
-        logger.info(f"Successfully generated content. Metadata URI: {result['metadata_uri']}")
-        
-        return GenerateResponse(
-            metadata_uri=result["metadata_uri"],
-            video_uri=result["video_uri"],
-            script=result["script"],
-            thumbnail_uri=result.get("thumbnail_uri", "")
-        )
+        logger.info(f"Queued generation job {task.id}")
+        return GenerateJobResponse(job_id=task.id)
     
     except Exception as e:
-        logger.error(f"Error generating content: {str(e)}", exc_info=True)
+        logger.error(f"Error queueing generation job: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
-            detail={"error": "Failed to generate content", "details": str(e)}
+            detail={"error": "Failed to queue generation job", "details": str(e)}
+        )
+
+
+@app.get("/generate/{job_id}", response_model=GenerateStatusResponse)
+def generate_status(job_id: str):
+    """
+    Get the state of a generation job queued by POST /generate.
+    
+    Unknown job IDs are reported as PENDING, like jobs that have not started yet.
+    """
+    task = AsyncResult(job_id, app=celery_app)
+    status = GenerateStatusResponse(job_id=job_id, state=task.state)
+    
+    if task.state == "PROGRESS":
+        status.step = (task.info or {}).get("step")
+    elif task.state == "SUCCESS":
+        result = task.result
+        status.result = GenerateResponse(
+            metadata_uri=result["metadata_uri"],
+            video_uri=result["video_uri"],
+            script=result["script"],
+            thumbnail_uri=result.get("thumbnail_uri") or ""
         )
+    elif task.state == "FAILURE":
+        status.error = str(task.result)
+    
+    return status
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # The API only queues jobs and polls Redis, so it is pure I/O: one
+    # worker per CPU (override with WEB_CONCURRENCY)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    )
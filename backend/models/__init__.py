@@ -1,3 +1,15 @@
-from .api_models import GenerateRequest, GenerateResponse, ErrorResponse
+from .api_models import (
+    GenerateRequest,
+    GenerateResponse,
+    GenerateJobResponse,
+    GenerateStatusResponse,
+    ErrorResponse,
+)
 
-__all__ = ["GenerateRequest", "GenerateResponse", "ErrorResponse"] 
\ No newline at end of file
+__all__ = [
+    "GenerateRequest",
+    "GenerateResponse",
+    "GenerateJobResponse",
+    "GenerateStatusResponse",
+    "ErrorResponse",
+]
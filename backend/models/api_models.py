@@ -1,14 +1,16 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional
 
 
 class GenerateRequest(BaseModel):
     """Request model for the generate endpoint."""
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True, str_max_length=4096)
+    
     content: str = Field(..., description="The topic for the video (e.g., 'Chernobyl', 'Turtles')")
     style: str = Field(..., description="The style of brainrot content (e.g., 'Minecraft Parkour', 'Soap Cutting')")
     ticker: str = Field(..., description="Ticker symbol for the NFT (e.g., BRNRT)")
     description: str = Field(..., description="Description of the video")
-    duration: Optional[int] = Field(60, description="Target duration of the video in seconds")
+    duration: int = Field(60, ge=1, le=600, description="Target duration of the video in seconds")
 
 
 class GenerateResponse(BaseModel):
@@ -22,4 +24,18 @@ class GenerateResponse(BaseModel):
 class ErrorResponse(BaseModel):
     """Error response model."""
     error: str = Field(..., description="Error message")
-    details: Optional[str] = Field(None, description="Additional error details") 
\ No newline at end of file
+    details: Optional[str] = Field(None, description="Additional error details")
+
+
+class GenerateJobResponse(BaseModel):
+    """Response model for a queued generation job."""
+    job_id: str = Field(..., description="ID of the queued job, used to poll GET /generate/{job_id}")
+
+
+class GenerateStatusResponse(BaseModel):
+    """Response model for the generation job status endpoint."""
+    job_id: str = Field(..., description="ID of the generation job")
+    state: str = Field(..., description="Job state (PENDING, STARTED, PROGRESS, RETRY, SUCCESS or FAILURE)")
+    step: Optional[str] = Field(None, description="Current pipeline step while the job is in PROGRESS")
+    result: Optional[GenerateResponse] = Field(None, description="The generated content once the job has succeeded")
+    error: Optional[str] = Field(None, description="Error message if the job has failed")
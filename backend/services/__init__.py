@@ -1,6 +1,21 @@
-from .generation_service import GenerationService
-from .venice_service import VeniceService
-from .video_service import VideoService
-from .ipfs_service import IPFSService
+import importlib
 
-__all__ = ["GenerationService", "VeniceService", "VideoService", "IPFSService"] 
\ No newline at end of file
+# Services are imported on first access: VideoService pulls in Whisper
+# (CTranslate2), which processes that only queue jobs never need.
+_SERVICES = {
+    "GenerationService": ".generation_service",
+    "VeniceService": ".venice_service",
+    "VideoService": ".video_service",
+    "IPFSService": ".ipfs_service",
+    "CacheService": ".cache_service",
+}
+
+__all__ = list(_SERVICES)
+
+
+def __getattr__(name):
+    if name not in _SERVICES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    service = getattr(importlib.import_module(_SERVICES[name], __name__), name)
+    globals()[name] = service
+    return service
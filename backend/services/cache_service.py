@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import orjson
+import redis.asyncio as redis
+from utils.config import REDIS_URL
+
+# Cached Venice responses expire after a week
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+def _normalize(value):
+    """Normalize a cache key part so that casing and whitespace differences still hit."""
+    return " ".join(str(value).split()).casefold()
+
+class CacheService:
+    """Exact-match cache for Venice scripts, image prompts and images, stored in Redis.
+    
+    Keys are a SHA-256 of the normalized inputs (images reuse their disk cache
+    file name instead). Redis errors are logged and treated as cache misses so
+    that the pipeline never fails because of the cache.
+    """
+    def __init__(self):
+        self.redis = redis.from_url(REDIS_URL)
+        self.logger = logging.getLogger(__name__)
+    
+    async def aclose(self):
+        """Close the Redis connection pool."""
+        await self.redis.aclose()
+    
+    def _key(self, namespace, *parts):
+        digest = hashlib.sha256("|".join(_normalize(part) for part in parts).encode()).hexdigest()
+        return f"brainrotify:{namespace}:{digest}"
+    
+    async def _get(self, key):
+        try:
+            return await self.redis.get(key)
+        except redis.RedisError as e:
+            self.logger.warning(f"Cache lookup failed for {key}: {str(e)}")
+            return None
+    
+    async def _set(self, key, value):
+        try:
+            await self.redis.set(key, value, ex=CACHE_TTL_SECONDS)
+        except redis.RedisError as e:
+            self.logger.warning(f"Cache store failed for {key}: {str(e)}")
+    
+    async def get_script(self, content, style, duration):
+        """Return the cached script for (content, style, duration), or None."""
+        script = await self._get(self._key("script", content, style, duration))
+        return script.decode() if script else None
+    
+    async def put_script(self, content, style, duration, script):
+        """Cache the script generated for (content, style, duration)."""
+        await self._set(self._key("script", content, style, duration), script)
+    
+    async def get_prompts(self, content, style, script, count):
+        """Return the cached image prompts for a script, or None."""
+        prompts = await self._get(self._key("prompts", content, style, script, count))
+        return orjson.loads(prompts) if prompts else None
+    
+    async def put_prompts(self, content, style, script, count, prompts):
+        """Cache the image prompts generated for a script."""
+        await self._set(self._key("prompts", content, style, script, count), orjson.dumps(prompts))
+    
+    async def get_image(self, image_key):
+        """Return the cached PNG bytes for an image, or None.
+        
+        `image_key` is the name of the image's disk cache file, which already
+        digests the exact prompt and the generation settings, so it is used
+        as is rather than normalized.
+        """
+        return await self._get(f"brainrotify:image:{image_key}")
+    
+    async def put_image(self, image_key, image_data):
+        """Cache the PNG bytes generated for an image (see get_image)."""
+        await self._set(f"brainrotify:image:{image_key}", image_data)
@@ -1,23 +1,168 @@
 from .venice_service import VeniceService
 from .video_service import VideoService
 from .ipfs_service import IPFSService
-import uuid
+from .cache_service import CacheService
+from utils.paths import is_cached, temp_name
+import aiofiles
+import asyncio
 import logging
 import os
 
+# Maximum number of concurrent image generation requests to Venice
+MAX_CONCURRENT_IMAGES = 4
+
+# Streamed script sentences are sent to TTS in chunks of about this many characters
+TTS_CHUNK_CHARS = 300
+
+async def _replay(items):
+    """Async iterator over an already known list."""
+    for item in items:
+        yield item
+
 class GenerationService:
-    def __init__(self):
+    def __init__(self, ipfs_service=None):
         self.venice_service = VeniceService()
         self.video_service = VideoService()
-        self.ipfs_service = IPFSService()
-
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        )
+        # The IPFS service can be shared with tasks that only need pinning
+        self.ipfs_service = ipfs_service or IPFSService()
+        self.cache_service = CacheService()
+        self.image_semaphore = asyncio.Semaphore(MAX_CONCURRENT_IMAGES)
         self.logger = logging.getLogger(__name__)
     
-    async def generate_content(self, content, style, duration=60, image_count=None, ticker=None, description=None):
+    async def aclose(self):
+        """Release the network resources held by the underlying services."""
+        await self.venice_service.aclose()
+        await self.ipfs_service.aclose()
+        await self.cache_service.aclose()
+    
+    def _report(self, on_step, step):
+        """Forward the current pipeline step to the caller, if it asked for it."""
+        if on_step is not None:
+            on_step(step)
+    
+    async def _one_image(self, content, style, prompt=None):
+        """Generate a single image, holding the image semaphore to respect Venice rate limits.
+        
+        Images generated from an explicit prompt are cached by prompt, on local
+        disk first and then in Redis (shared between workers).
+        """
+        if prompt is not None:
+            image_file = self.venice_service.image_cache_path(prompt)
+            if is_cached(image_file):
+                self.logger.info(f"Using cached image for prompt: {prompt}")
+                return str(image_file)
+            
+            image_data = await self.cache_service.get_image(image_file.name)
+            if image_data:
+                tmp_file = image_file.with_name(temp_name(".tmp"))
+                async with aiofiles.open(tmp_file, "wb") as f:
+                    await f.write(image_data)
+                os.replace(tmp_file, image_file)
+                self.logger.info(f"Using cached image for prompt: {prompt}")
+                return str(image_file)
+        
+        async with self.image_semaphore:
+            image_file = await self.venice_service.generate_image(content, style, prompt=prompt)
+        
+        if prompt is not None:
+            async with aiofiles.open(image_file, "rb") as f:
+                await self.cache_service.put_image(os.path.basename(image_file), await f.read())
+        return image_file
+    
+    async def _generate_images(self, content, style, script, count):
+        """Generate `count` images for the script concurrently.
+        
+        Args:
+            content (str): The topic for the video
+            style (str): The style of brainrot content
+            script (str): The script text used to derive the image prompts
+            count (int): Number of images to generate
+            
+        Returns:
+            list: List of paths to the saved image files, in prompt order
+        """
+        prompts = await self.cache_service.get_prompts(content, style, script, count)
+        if prompts:
+            self.logger.info("Using cached image prompts")
+        else:
+            prompts = await self.venice_service.generate_image_prompts(content, style, script, count=count)
+            # Only cache a full set of LLM prompts, never the generic backups
+            backups = {self.venice_service.backup_image_prompt(content, style, n) for n in range(1, count + 1)}
+            if not backups.intersection(prompts):
+                await self.cache_service.put_prompts(content, style, script, count, prompts)
+        results = await asyncio.gather(
+            *[self._one_image(content, style, prompt) for prompt in prompts],
+            return_exceptions=True
+        )
+        image_files = [result for result in results if not isinstance(result, Exception)]
+        
+        # If some prompts failed, fill the gaps with generic images about the content
+        if len(image_files) < count:
+            self.logger.warning(f"Could only generate {len(image_files)} images with prompts, using fallback method for remaining images")
+            image_files += await asyncio.gather(
+                *[self._one_image(content, style) for _ in range(count - len(image_files))]
+            )
+        
+        return image_files
+    
+    async def _speak_sentences(self, sentences):
+        """Start converting script sentences to speech as they arrive.
+        
+        A producer pushes sentences onto a queue as they stream in and a consumer
+        sends them to TTS in chunks of about TTS_CHUNK_CHARS characters, so speech
+        synthesis overlaps with script generation. Cached scripts are replayed
+        through the same chunking so their TTS chunks hit the audio cache.
+        
+        Args:
+            sentences (async iterable): The script sentences, in order
+            
+        Returns:
+            tuple: (The full script, list of TTS tasks for the chunks, in order)
+        """
+        queue = asyncio.Queue()
+        script = []
+        
+        async def produce():
+            try:
+                async for sentence in sentences:
+                    await queue.put(sentence)
+            finally:
+                await queue.put(None)
+        
+        async def consume():
+            tts_tasks, pending = [], []
+            while (sentence := await queue.get()) is not None:
+                script.append(sentence)
+                pending.append(sentence)
+                if sum(len(part) for part in pending) >= TTS_CHUNK_CHARS:
+                    tts_tasks.append(asyncio.ensure_future(self.venice_service.generate_tts_chunk(" ".join(pending))))
+                    pending = []
+            if pending:
+                tts_tasks.append(asyncio.ensure_future(self.venice_service.generate_tts_chunk(" ".join(pending))))
+            return tts_tasks
+        
+        consumer = asyncio.ensure_future(consume())
+        try:
+            await produce()
+        except Exception:
+            for task in await consumer:
+                task.cancel()
+            raise
+        tts_tasks = await consumer
+        return " ".join(script), tts_tasks
+    
+    async def _join_tts(self, tts_tasks, script):
+        """Wait for the TTS chunks and join them into one audio file.
+        
+        Returns:
+            tuple: (Path to the audio file, duration in seconds)
+        """
+        audio_files = await asyncio.gather(*tts_tasks)
+        if not audio_files:
+            raise Exception("Venice returned an empty script")
+        return await self.venice_service.concat_audio(audio_files, script)
+    
+    async def generate_content(self, content, style, duration=60, image_count=None, ticker=None, description=None, on_step=None):
         """Generate a full video including script, TTS, multiple images, and upload to IPFS.
         
         Args:
@@ -25,9 +170,11 @@ class GenerationService:
             style (str): The style of brainrot content
             duration (int, optional): Target duration in seconds. Defaults to 60.
             image_count (int, optional): Number of images to generate. If None, will calculate
-                                         based on audio duration (1 image per 10 seconds).
+                                         based on the estimated narration length (1 image per 10 seconds).
             ticker (str, optional): Ticker symbol for the NFT
             description (str, optional): Description of the video
+            on_step (callable, optional): Called with the name of each pipeline step
+                                          ("script", "tts", "images", "video", "upload", "metadata")
             
         Returns:
             dict: Result containing metadata_uri, video_uri, script, and thumbnail_uri
@@ -35,51 +182,58 @@ class GenerationService:
         try:
             # 1. Generate script
             self.logger.info("Generating Script")
-            script = await self.venice_service.generate_script(content, style, duration)
-            
-            # 2. Generate TTS audio and get the file path directly
-            self.logger.info("Generating TTS")
-            audio_file, audio_duration = await self.venice_service.generate_tts(script)
+            self._report(on_step, "script")
+            script = await self.cache_service.get_script(content, style, duration)
+            if script:
+                self.logger.info("Using cached script")
+                _, tts_tasks = await self._speak_sentences(_replay(self.venice_service.split_sentences(script)))
+            else:
+                # Speech synthesis starts on the first sentences while the rest of the script streams in
+                script, tts_tasks = await self._speak_sentences(self.venice_service.stream_script(content, style, duration))
+                if script:
+                    await self.cache_service.put_script(content, style, duration, script)
+            tts = self._join_tts(tts_tasks, script)
             
-            # Calculate number of images based on audio duration if not specified
-            # Use 1 image per 10 seconds of audio, minimum 1 image
+            # 2-3. Finish the TTS audio and generate the images for the video concurrently.
+            # The images only depend on the script, so unless the count is given it is
+            # estimated from the script length (1 image per 10 seconds, minimum 1 image)
+            # rather than waiting for the audio duration.
             if image_count is None:
-                image_count = max(1, int(audio_duration / 10) + 1)
-                self.logger.info(f"Calculated {image_count} images needed for {audio_duration:.2f} seconds of audio")
+                estimated_duration = self.venice_service.estimate_duration(script)
+                image_count = max(1, int(estimated_duration / 10) + 1)
+                self.logger.info(f"Estimated {image_count} images needed for {estimated_duration:.2f} seconds of audio")
             
-            # 3. Generate multiple images based on the script and get the file paths
-            self.logger.info(f"Generating {image_count} Images")
-            image_files = await self.venice_service.generate_multiple_images(content, style, script, count=image_count)
+            self.logger.info(f"Generating TTS and {image_count} Images")
+            self._report(on_step, "tts")
+            (audio_file, audio_duration), image_files = await asyncio.gather(
+                tts,
+                self._generate_images(content, style, script, image_count)
+            )
             
             # 4. Create video with multiple images and audio
             self.logger.info("Creating Video with Multiple Images")
+            self._report(on_step, "video")
             video_file = await self.video_service.create_video(image_files, audio_file, script)
             
-            # 5. Upload first image as thumbnail
-            self.logger.info("Uploading Thumbnail Image")
-            thumbnail_uri = None
-            if image_files and len(image_files) > 0:
-                # Use the first image as the thumbnail
-                thumbnail_file = image_files[0]
+            # 5-6. Upload the video and the first image as thumbnail concurrently
+            self.logger.info("Uploading Video and Thumbnail Image")
+            self._report(on_step, "upload")
+            uploads = [video_file]
+            if image_files:
                 # Add metadata for the thumbnail
                 thumbnail_metadata = {
                     "type": "thumbnail",
                     "content": content,
                     "style": style
                 }
-                thumbnail_uri = await self.ipfs_service.upload_file(
-                    thumbnail_file,
-                    name=f"thumbnail_{content}_{style}.png",
-                    keyvalues=thumbnail_metadata
-                )
-                self.logger.info(f"Thumbnail uploaded: {thumbnail_uri}")
-            
-            # 6. Upload video to IPFS
-            self.logger.info("Uploading Video")
-            video_uri = await self.ipfs_service.upload_file(video_file)
+                uploads.append((image_files[0], f"thumbnail_{content}_{style}.png", thumbnail_metadata))
+            video_uri, *thumbnail_uris = await self.ipfs_service.upload_files(uploads)
+            thumbnail_uri = thumbnail_uris[0] if thumbnail_uris else None
+            self.logger.info(f"Video uploaded: {video_uri}, thumbnail uploaded: {thumbnail_uri}")
             
             # 7. Create metadata with thumbnail, ticker, and description
             self.logger.info("Creating Metadata")
+            self._report(on_step, "metadata")
             metadata = self.ipfs_service.create_metadata(
                 content, 
                 style, 
@@ -94,8 +248,8 @@ class GenerationService:
             metadata_uri = await self.ipfs_service.upload_json(metadata)
             
             # 9. Cleanup temporary files
-            # await self.video_service.cleanup()
-            self.venice_service.cleanup()
+            await self.video_service.cleanup()
+            await self.venice_service.cleanup()
             
             # 10. Return result
             return {
@@ -107,7 +261,7 @@ class GenerationService:
         
         except Exception as e:
             # Make sure to clean up on error
-            # await self.video_service.cleanup()
-            self.venice_service.cleanup()
+            await self.video_service.cleanup()
+            await self.venice_service.cleanup()
             self.logger.error(f"Error in generate_content: {str(e)}")
             raise e 
\ No newline at end of file
@@ -1,16 +1,39 @@
-import json
+import hashlib
+import orjson
 import httpx
 import os
 import asyncio
+import uuid
+import mimetypes
 from pathlib import Path
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
+import aiofiles
+from utils.paths import file_digest
+from utils.retry import retry_delay
+
+# Size of the chunks read from disk while streaming a file upload
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Maximum number of concurrent uploads in a batch
+MAX_CONCURRENT_UPLOADS = 4
+
+# Connection-level retries are handled by the transport; these only cover
+# requests that reached Pinata and were rejected as rate-limited or failed
+MAX_POST_ATTEMPTS = 3
+RETRY_BACKOFF_MIN = 2.0
+RETRY_BACKOFF_MAX = 10.0
+
+def _quote_form_value(value):
+    """Escape a multipart header parameter the same way httpx does (HTML5 form encoding)."""
+    value = value.replace("\\", "\\\\").replace('"', "%22")
+    return "".join(f"%{ord(c):02X}" if ord(c) < 0x20 and c != "\x1b" else c for c in value)
 
 class IPFSService:
     def __init__(self):
         # Using Pinata as the IPFS service
         self.pinata_upload_url = "https://uploads.pinata.cloud/v3/files"
         self.pinata_json_url = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
+        self.gateway_url = "https://apricot-defensive-vole-912.mypinata.cloud/ipfs"
         
         # Get JWT from environment variable
         self.pinata_jwt = os.environ.get("PINATA_JWT")
@@ -22,8 +45,102 @@ class IPFSService:
             self.logger.warning("PINATA_JWT not found in environment. Using mock mode for IPFS uploads.")
         else:
             self.logger.info("Using Pinata for IPFS uploads")
+        
+        # Long-lived client so uploads reuse pooled (HTTP/2) connections to Pinata;
+        # connection failures are retried by the transport before any body is sent
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=40)
+            ),
+            timeout=httpx.Timeout(60.0)
+        )
+        self.upload_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+        
+        # One random boundary serves every upload, so the parts shared by all
+        # requests are encoded once here instead of per upload
+        self.boundary = uuid.uuid4().hex
+        self.multipart_content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.network_field = (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="network"\r\n\r\npublic\r\n'
+        ).encode()
+        self.closing_boundary = f"\r\n--{self.boundary}--\r\n".encode()
+    
+    async def aclose(self):
+        """Close the underlying HTTP client."""
+        await self.client.aclose()
+    
+    def _mock_file_uri(self, file_path):
+        """Deterministic mock URI for a file, derived from a digest of its content (blocking)."""
+        return f"ipfs://Qm{file_digest(file_path)}"
+    
+    def _mock_json_uri(self, metadata):
+        """Deterministic mock URI for JSON metadata: the same metadata always maps to the same URI."""
+        metadata_bytes = orjson.dumps(metadata, option=orjson.OPT_SORT_KEYS)
+        return f"ipfs://Qm{hashlib.blake2b(metadata_bytes, digest_size=16).hexdigest()}"
+    
+    async def _post(self, url, build_request, timeout=None):
+        """POST to Pinata, re-sending only on 429 and 5xx responses.
+        
+        Args:
+            url (str): The endpoint to post to
+            build_request (callable): Returns the (headers, content) of a fresh
+                                      request; called again for each attempt so
+                                      streamed bodies can be re-sent
+            timeout (float, optional): Per-request timeout override
+            
+        Returns:
+            httpx.Response: The last response received
+        """
+        for attempt in range(MAX_POST_ATTEMPTS):
+            headers, content = build_request()
+            kwargs = {"timeout": timeout} if timeout is not None else {}
+            response = await self.client.post(url, headers=headers, content=content, **kwargs)
+            
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt == MAX_POST_ATTEMPTS - 1:
+                return response
+            
+            delay = retry_delay(response, attempt, RETRY_BACKOFF_MIN, RETRY_BACKOFF_MAX)
+            self.logger.warning(f"Pinata returned {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        
+        return response
+    
+    def _multipart_envelope(self, file_name, form_data):
+        """Encode the multipart/form-data bytes that surround a file upload.
+        
+        Only the small form fields and part headers are held in memory; the
+        file itself is streamed between them by _stream_body.
+        
+        Args:
+            file_name (str): The file name sent to Pinata
+            form_data (dict): Additional form fields
+            
+        Returns:
+            tuple: (bytes before the file content, bytes after it)
+        """
+        content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+        head = self.network_field + b"".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote_form_value(key)}"\r\n\r\n{value}\r\n'.encode()
+            for key, value in form_data.items()
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; filename="{_quote_form_value(file_name)}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        return head, self.closing_boundary
+    
+    async def _stream_body(self, head, file_path, tail):
+        """Yield a multipart body, reading the file from disk in chunks."""
+        yield head
+        async with aiofiles.open(file_path, "rb") as f:
+            while chunk := await f.read(UPLOAD_CHUNK_SIZE):
+                yield chunk
+        yield tail
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
     async def upload_file(self, file_path, name=None, keyvalues=None):
         """Upload a file to IPFS using Pinata and return the IPFS hash (CID).
         
@@ -37,57 +154,55 @@ class IPFSService:
         """
         if self.use_mock:
             # Mock response for demo purposes
-            return f"ipfs://Qm{Path(file_path).name.replace('.', '')[:32]}"
+            return await asyncio.to_thread(self._mock_file_uri, file_path)
         
         try:
             file_path = Path(file_path)
-            if not file_path.exists():
+            # A single stat off the event loop both checks the file exists and sizes the body
+            try:
+                file_size = (await asyncio.to_thread(file_path.stat)).st_size
+            except FileNotFoundError:
                 raise FileNotFoundError(f"File not found: {file_path}")
             
-            # Prepare headers with JWT
-            headers = {
-                "Authorization": f"Bearer {self.pinata_jwt}"
-            }
-            
             # Prepare files and data for multipart upload
             file_name = name or file_path.name
             
-            # Prepare the multipart form data
-            form_data = {"network": "public"}
+            # Prepare the multipart form data ("network" is part of the shared envelope)
+            form_data = {}
             if keyvalues:
-                form_data["keyvalues"] = json.dumps(keyvalues)
-                
-            files = {
-                "file": (file_name, open(file_path, "rb"))
+                form_data["keyvalues"] = orjson.dumps(keyvalues).decode()
+            head, tail = self._multipart_envelope(file_name, form_data)
+            
+            # Prepare headers with JWT
+            headers = {
+                "Authorization": f"Bearer {self.pinata_jwt}",
+                "Content-Type": self.multipart_content_type,
+                "Content-Length": str(len(head) + file_size + len(tail))
             }
             
+            def build_request():
+                # Stream the multipart body from disk instead of buffering the file;
+                # a retry only needs a fresh reader, the envelope is reused
+                return headers, self._stream_body(head, file_path, tail)
+            
             # Use httpx for async file upload
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                self.logger.info(f"Uploading file {file_path} to Pinata...")
-                response = await client.post(
-                    self.pinata_upload_url,
-                    headers=headers,
-                    data=form_data,
-                    files=files
-                )
-                
-                # Close the file handle
-                files["file"][1].close()
-                
-                # Check response
-                if response.status_code != 200:
-                    self.logger.error(f"Pinata upload failed: {response.status_code} - {response.text}")
-                    raise Exception(f"Pinata upload failed: {response.status_code} - {response.text}")
-                
-                # Parse response
-                result = response.json()
-                if "data" not in result or "cid" not in result["data"]:
-                    raise ValueError(f"Unexpected Pinata response format: {result}")
-                
-                cid = result["data"]["cid"]
-                self.logger.info(f"File uploaded successfully with CID: {cid}")
-                return f"https://apricot-defensive-vole-912.mypinata.cloud/ipfs/{cid}"
-                # return f"ipfs://{cid}"
+            self.logger.info(f"Uploading file {file_path} to Pinata...")
+            response = await self._post(self.pinata_upload_url, build_request)
+            
+            # Check response
+            if response.status_code != 200:
+                self.logger.error(f"Pinata upload failed: {response.status_code} - {response.text}")
+                raise Exception(f"Pinata upload failed: {response.status_code} - {response.text}")
+            
+            # Parse response
+            result = response.json()
+            if "data" not in result or "cid" not in result["data"]:
+                raise ValueError(f"Unexpected Pinata response format: {result}")
+            
+            cid = result["data"]["cid"]
+            self.logger.info(f"File uploaded successfully with CID: {cid}")
+            return f"{self.gateway_url}/{cid}"
+            # return f"ipfs://{cid}"
                 
         except Exception as e:
             self.logger.error(f"Error uploading file to IPFS: {str(e)}")
@@ -95,9 +210,30 @@ class IPFSService:
                 # If we're not in mock mode, re-raise the exception
                 raise
             # In mock mode, return a mock CID
-            return f"ipfs://Qm{Path(file_path).name.replace('.', '')[:32]}"
+            return await asyncio.to_thread(self._mock_file_uri, file_path)
+    
+    async def upload_files(self, files):
+        """Upload several files to IPFS concurrently.
+        
+        Args:
+            files (list): Items to upload, each either a file path or a
+                          (file_path, name, keyvalues) tuple as taken by upload_file
+            
+        Returns:
+            list: The IPFS URIs of the uploaded files, in the same order
+        """
+        specs = [item if isinstance(item, tuple) else (item,) for item in files]
+        
+        if self.use_mock:
+            # Hash all files in one worker thread instead of one hop per file
+            return await asyncio.to_thread(lambda: [self._mock_file_uri(spec[0]) for spec in specs])
+        
+        async def upload(spec):
+            async with self.upload_semaphore:
+                return await self.upload_file(*spec)
+        
+        return list(await asyncio.gather(*[upload(spec) for spec in specs]))
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
     async def upload_json(self, metadata):
         """Upload JSON metadata to IPFS using Pinata.
         
@@ -109,9 +245,7 @@ class IPFSService:
         """
         if self.use_mock:
             # Mock response for demo purposes
-            metadata_str = json.dumps(metadata)
-            mock_hash = hex(hash(metadata_str) % 10**32)[2:]
-            return f"ipfs://Qm{mock_hash[:32]}"
+            return self._mock_json_uri(metadata)
         
         try:
             # Prepare headers with JWT
@@ -120,31 +254,32 @@ class IPFSService:
                 "Content-Type": "application/json"
             }
             
+            body = orjson.dumps({
+                "pinataContent": metadata
+            })
+            
             # Use httpx for async JSON upload
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                self.logger.info("Uploading JSON metadata to Pinata...")
-                response = await client.post(
-                    self.pinata_json_url,
-                    headers=headers,
-                    json={
-                        "pinataContent": metadata
-                    }
-                )
-                
-                # Check response
-                if response.status_code != 200:
-                    self.logger.error(f"Pinata JSON upload failed: {response.status_code} - {response.text}")
-                    raise Exception(f"Pinata JSON upload failed: {response.status_code} - {response.text}")
-                
-                # Parse response
-                result = response.json()
-                if "IpfsHash" not in result:
-                    raise ValueError(f"Unexpected Pinata response format: {result}")
-                
-                cid = result["IpfsHash"]
-                self.logger.info(f"JSON uploaded successfully with CID: {cid}")
-                return f"https://apricot-defensive-vole-912.mypinata.cloud/ipfs/{cid}"
-                # return f"ipfs://{cid}"
+            self.logger.info("Uploading JSON metadata to Pinata...")
+            response = await self._post(
+                self.pinata_json_url,
+                lambda: (headers, body),
+                timeout=30.0
+            )
+            
+            # Check response
+            if response.status_code != 200:
+                self.logger.error(f"Pinata JSON upload failed: {response.status_code} - {response.text}")
+                raise Exception(f"Pinata JSON upload failed: {response.status_code} - {response.text}")
+            
+            # Parse response
+            result = response.json()
+            if "IpfsHash" not in result:
+                raise ValueError(f"Unexpected Pinata response format: {result}")
+            
+            cid = result["IpfsHash"]
+            self.logger.info(f"JSON uploaded successfully with CID: {cid}")
+            return f"{self.gateway_url}/{cid}"
+            # return f"ipfs://{cid}"
                 
         except Exception as e:
             self.logger.error(f"Error uploading JSON to IPFS: {str(e)}")
@@ -152,9 +287,33 @@ class IPFSService:
                 # If we're not in mock mode, re-raise the exception
                 raise
             # In mock mode, return a mock CID
-            metadata_str = json.dumps(metadata)
-            mock_hash = hex(hash(metadata_str) % 10**32)[2:]
-            return f"ipfs://Qm{mock_hash[:32]}"
+            return self._mock_json_uri(metadata)
+    
+    async def verify_pin(self, uri):
+        """Check that an uploaded file is retrievable through the IPFS gateway.
+        
+        This is not needed to build the metadata (which only needs the URIs),
+        so callers run it in the background after the upload has returned.
+        
+        Args:
+            uri (str): The gateway URI returned by upload_file or upload_json
+            
+        Returns:
+            bool: True if the gateway serves the file
+        """
+        if self.use_mock or not uri.startswith(self.gateway_url):
+            return True
+        
+        try:
+            response = await self.client.head(uri, follow_redirects=True, timeout=30.0)
+            if response.status_code != 200:
+                self.logger.warning(f"Pin not yet available for {uri}: {response.status_code}")
+                return False
+            self.logger.info(f"Pin verified for {uri}")
+            return True
+        except httpx.HTTPError as e:
+            self.logger.warning(f"Error verifying pin for {uri}: {str(e)}")
+            return False
     
     def create_metadata(self, content, style, video_ipfs_uri, thumbnail_ipfs_uri , ticker, description):
         """Create metadata for the NFT.
@@ -1,13 +1,61 @@
 import httpx
 import logging
-import base64
+import asyncio
+import binascii
+import hashlib
+import orjson
 import os
-import uuid
+import re
+from contextlib import asynccontextmanager
 from pathlib import Path
 import tempfile
-from utils.config import VENICE_API_KEY
+import aiofiles
+from utils.config import DISK_CACHE_MAX_AGE_DAYS, VENICE_API_KEY
+from utils.media import probe_duration
+from utils.paths import drop_page_cache, is_cached, prune_files, remove_files, temp_name
+from utils.retry import retry_delay
+
+# Size of the chunks written to disk while streaming a TTS or image response
+STREAM_CHUNK_SIZE = 1 << 16
+
+# Sentence boundary in streamed script text
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# One entry of the LLM's numbered image prompt list ("3. A cat on a skateboard")
+_PROMPT_LINE = re.compile(r"^\s*(\d+)\.\s*(.+?)\s*$")
+
+# Speaking rate used to estimate narration length from the script text
+SPEECH_CHARS_PER_SECOND = 15.0
+
+# Venice requests are re-sent on 429, 5xx and timeouts, with exponential backoff
+MAX_ATTEMPTS = 4
+RETRY_BACKOFF_MIN = 1.0
+RETRY_BACKOFF_MAX = 30.0
 
 class VeniceService:
+    # Static parts of the request bodies; only the inputs are filled in per call
+    _SCRIPT_SYSTEM_MESSAGE = {
+        "role": "system",
+        "content": "You are an expert in creating viral social media scripts in Text directly. There is only one character and that is the narrator so the script is what the narrator will narrate. Return the script directly WITHOUT any sound effects or pauses in paranthesis. Do not explain the script."
+    }
+    _PROMPTS_SYSTEM_MESSAGE = {
+        "role": "system",
+        "content": "You are an expert at creating diverse image prompts for a video. Generate varied and interesting prompts based on the script."
+    }
+    _TTS_BODY_TEMPLATE = {
+        "model": "tts-kokoro",
+        "voice": "am_adam"  # Using a default voice
+    }
+    _IMG_BODY_TEMPLATE = {
+        "model": "fluently-xl",
+        "height": 512,
+        "width": 512,
+        "steps": 20,
+        "return_binary": True,
+        "hide_watermark": True,
+        "format": "png",
+    }
+    
     def __init__(self):
         self.api_key = VENICE_API_KEY
         self.base_url = "https://api.venice.ai/api/v1"
@@ -16,50 +64,183 @@ class VeniceService:
             "Content-Type": "application/json"
         }
         self.logger = logging.getLogger(__name__)
+        # Long-lived client so Venice calls reuse pooled (HTTP/2) connections.
+        # The transport retries failed connection attempts; _send handles the rest.
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=httpx.Timeout(60.0),
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+            )
+        )
         # Create a temp directory for processing
         self.temp_dir = Path(tempfile.gettempdir()) / "brainrotify"
         os.makedirs(self.temp_dir, exist_ok=True)
+        # Files written by this service; the temp dir is shared with other workers
+        self._created_files = set()
+        # Content-addressed TTS audio and prompted images, kept across requests
+        # so identical inputs are served from disk (cleanup only prunes the
+        # entries unused for DISK_CACHE_MAX_AGE_DAYS)
+        self.cache_dir = Path(tempfile.gettempdir()) / "brainrotify_cache"
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    async def aclose(self):
+        """Close the underlying HTTP client."""
+        await self.client.aclose()
+    
+    async def _send(self, path, payload, stream=False):
+        """POST a JSON payload to Venice, re-sending on 429, 5xx and timeouts.
+        
+        Other 4xx responses fail immediately. Streamed responses must be
+        closed by the caller.
+        
+        Args:
+            path (str): The endpoint to post to
+            payload (dict): The JSON request body
+            stream (bool): Return before reading the response body
+            
+        Returns:
+            httpx.Response: A successful response
+        """
+        content = orjson.dumps(payload)
+        for attempt in range(MAX_ATTEMPTS):
+            last_attempt = attempt == MAX_ATTEMPTS - 1
+            try:
+                response = await self.client.send(
+                    self.client.build_request("POST", path, content=content),
+                    stream=stream
+                )
+            except httpx.TimeoutException:
+                if last_attempt:
+                    raise
+                delay = retry_delay(None, attempt, RETRY_BACKOFF_MIN, RETRY_BACKOFF_MAX, jitter=True)
+                self.logger.warning(f"Venice request to {path} timed out, retrying in {delay:.1f}s")
+            else:
+                if (response.status_code != 429 and response.status_code < 500) or last_attempt:
+                    try:
+                        response.raise_for_status()
+                    except httpx.HTTPStatusError:
+                        await response.aclose()
+                        raise
+                    return response
+                await response.aclose()
+                delay = retry_delay(response, attempt, RETRY_BACKOFF_MIN, RETRY_BACKOFF_MAX, jitter=True)
+                self.logger.warning(f"Venice returned {response.status_code} for {path}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    
+    async def _post(self, path, payload):
+        """POST a JSON payload to Venice and read the whole response."""
+        return await self._send(path, payload)
+    
+    @asynccontextmanager
+    async def _stream(self, path, payload):
+        """POST a JSON payload to Venice and stream the response body."""
+        response = await self._send(path, payload, stream=True)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+    
+    async def _write_stream(self, response, path):
+        """Write a streamed response body to `path` as it arrives."""
+        # Bodies without a Content-Encoding are written as received, skipping
+        # httpx's decoder and re-chunking; unbuffered since chunks are already large
+        if "content-encoding" in response.headers:
+            chunks = response.aiter_bytes(STREAM_CHUNK_SIZE)
+        else:
+            chunks = response.aiter_raw(STREAM_CHUNK_SIZE)
+        async with aiofiles.open(path, "wb", buffering=0) as f:
+            async for chunk in chunks:
+                await f.write(chunk)
     
-    async def generate_script(self, content, style, duration_seconds=60):
-        """Generate a script based on the given content and style.
+    def _cache_path(self, suffix, *parts):
+        """Content-addressed path in the cache directory for the given inputs."""
+        key = hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+        return self.cache_dir / f"{key}{suffix}"
+    
+    def tts_cache_path(self, text):
+        """Path the TTS audio for `text` is stored at."""
+        body = self._TTS_BODY_TEMPLATE
+        return self._cache_path(".mp3", body["model"], body["voice"], text)
+    
+    def image_cache_path(self, prompt):
+        """Path the image generated from `prompt` is stored at."""
+        body = self._IMG_BODY_TEMPLATE
+        return self._cache_path(
+            ".png", body["model"], f"{body['width']}x{body['height']}", str(body["steps"]), prompt
+        )
+    
+    def _decode_and_write(self, encoded, path):
+        """Decode a base64 image and write it to the cache (blocking)."""
+        # a2b_base64 skips b64decode's extra validation pass
+        self._write_atomic(path, binascii.a2b_base64(encoded))
+    
+    def _write_atomic(self, path, data):
+        """Write a cache file so that concurrent readers never see it half-written."""
+        tmp_file = path.with_name(temp_name(".tmp"))
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+    
+    def _script_request(self, content, style, duration_seconds, stream=False):
+        """Build the chat completion request body for a script."""
+        return {
+            "model": "llama-3.1-405b",
+            "messages": [
+                self._SCRIPT_SYSTEM_MESSAGE,
+                {
+                    "role": "user",
+                    "content": f"Create a viral social media script about {content} in the style of {style} brainrot videos. The script should be about {duration_seconds} seconds when read aloud."
+                }
+            ],
+            "max_tokens": 1000,
+            "stream": stream
+        }
+    
+    def split_sentences(self, text):
+        """Split script text into sentences the same way stream_script does."""
+        return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+    
+    async def stream_script(self, content, style, duration_seconds=60):
+        """Generate a script from the _script_request prompt, yielding it sentence by sentence as it streams in.
         
         Args:
             content (str): The topic for the video
-            style (str): The style of brainrot content (e.g., "Minecraft Parkour", "Soap Cutting")
+            style (str): The style of brainrot content
             duration_seconds (int): Target duration of the script in seconds
             
-        Returns:
-            str: The generated script
+        Yields:
+            str: The next complete sentence of the script
         """
         try:
-            self.logger.info(f"Generating script for content: {content}, style: {style}")
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
-                    json={
-                        "model": "llama-3.1-405b",
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "You are an expert in creating viral social media scripts in Text directly. There is only one character and that is the narrator so the script is what the narrator will narrate. Return the script directly WITHOUT any sound effects or pauses in paranthesis. Do not explain the script."
-                            },
-                            {
-                                "role": "user",
-                                "content": f"Create a viral social media script about {content} in the style of {style} brainrot videos. The script should be about {duration_seconds} seconds when read aloud."
-                            }
-                        ],
-                        "max_tokens": 1000
-                    }
-                )
-                response.raise_for_status()
-                
-                # Extract the generated text from the chat API response
-                choices = response.json().get("choices", [])
-                if choices and len(choices) > 0:
-                    message = choices[0].get("message", {})
-                    return message.get("content", "")
-                return ""
+            self.logger.info(f"Streaming script for content: {content}, style: {style}")
+            buffer = ""
+            async with self._stream(
+                "/chat/completions",
+                self._script_request(content, style, duration_seconds, stream=True)
+            ) as response:
+                # Server-sent events: one "data: {...}" line per token delta
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = orjson.loads(data).get("choices", [])
+                    if not choices:
+                        continue
+                    buffer += choices[0].get("delta", {}).get("content") or ""
+                    
+                    *sentences, buffer = _SENTENCE_END.split(buffer)
+                    for sentence in sentences:
+                        if sentence.strip():
+                            yield sentence.strip()
+            
+            if buffer.strip():
+                yield buffer.strip()
         except httpx.ConnectError as e:
             self.logger.error(f"Connection error to Venice API: {str(e)}")
             raise Exception(f"Failed to connect to Venice API: {str(e)}")
@@ -70,110 +251,163 @@ class VeniceService:
             self.logger.error(f"HTTP error from Venice API: {str(e)}")
             raise Exception(f"HTTP error from Venice API: {str(e)}")
         except Exception as e:
-            self.logger.error(f"Unexpected error generating script: {str(e)}")
-            raise Exception(f"Unexpected error generating script: {str(e)}")
+            self.logger.error(f"Unexpected error streaming script: {str(e)}")
+            raise Exception(f"Unexpected error streaming script: {str(e)}")
     
-    async def generate_tts(self, script):
-        """Generate text-to-speech audio from the script and save to a file.
+    async def generate_tts_chunk(self, text):
+        """Convert a piece of the script to speech and save it to a file.
         
         Args:
-            script (str): The script to convert to speech
+            text (str): The text to convert to speech
             
         Returns:
-            tuple: (Path to the saved audio file, duration in seconds)
+            str: Path to the saved audio file
         """
+        audio_file = self.tts_cache_path(text)
+        if is_cached(audio_file):
+            self.logger.info(f"Using cached audio {audio_file}")
+            return str(audio_file)
+        
+        # Stream the audio straight to disk instead of buffering the whole response
+        tmp_file = audio_file.with_name(temp_name(".tmp"))
         try:
-            self.logger.info("Generating TTS from script")
-            self.logger.info(f"Script: {script}")
-            audio_file = self.temp_dir / f"{uuid.uuid4()}.mp3"
+            async with self._stream(
+                "/audio/speech",
+                {**self._TTS_BODY_TEMPLATE, "input": text}
+            ) as response:
+                await self._write_stream(response, tmp_file)
+            os.replace(tmp_file, audio_file)
+        except BaseException:
+            # Don't leave a partial download in the cache directory
+            tmp_file.unlink(missing_ok=True)
+            raise
+        
+        self.logger.info(f"Audio saved to {audio_file}")
+        return str(audio_file)
+    
+    async def concat_audio(self, audio_files, script):
+        """Join TTS chunks into a single audio file with the ffmpeg concat demuxer.
+        
+        Args:
+            audio_files (list): Paths to the audio chunks, in order
+            script (str): The full script, used to estimate the duration if it cannot be read
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/audio/speech",
-                    headers=self.headers,
-                    json={
-                        "model": "tts-kokoro",
-                        "input": script,
-                        "voice": "am_adam"  # Using a default voice
-                    }
-                )
-                response.raise_for_status()
-                
-                # Save audio data directly to file
-                with open(audio_file, "wb") as f:
-                    f.write(response.content)
-                
-                self.logger.info(f"Audio saved to {audio_file}")
-                
-                # Get duration of the audio file using moviepy
-                try:
-                    import moviepy.editor as mpy
-                    audio_clip = mpy.AudioFileClip(str(audio_file))
-                    duration = audio_clip.duration
-                    audio_clip.close()
-                    self.logger.info(f"Audio duration: {duration} seconds")
-                except Exception as e:
-                    self.logger.error(f"Error getting audio duration: {str(e)}")
-                    # Estimate duration based on script length (about 15 characters per second as fallback)
-                    duration = len(script) / 15.0
-                    self.logger.info(f"Estimated audio duration: {duration} seconds (based on text length)")
-                
-                return str(audio_file), duration
-        except httpx.ConnectError as e:
-            self.logger.error(f"Connection error to Venice API: {str(e)}")
-            raise Exception(f"Failed to connect to Venice API: {str(e)}")
-        except httpx.TimeoutException as e:
-            self.logger.error(f"Timeout connecting to Venice API: {str(e)}")
-            raise Exception(f"Timeout connecting to Venice API: {str(e)}")
-        except httpx.HTTPStatusError as e:
-            self.logger.error(f"HTTP error from Venice API: {str(e)}")
-            raise Exception(f"HTTP error from Venice API: {str(e)}")
+        Returns:
+            tuple: (Path to the joined audio file, duration in seconds)
+        """
+        if len(audio_files) == 1:
+            return audio_files[0], await self._audio_duration(audio_files[0], script)
+        
+        # The chunks are content-addressed, so their names identify the joined audio
+        audio_file = self._cache_path(".mp3", "concat", *(Path(chunk_file).name for chunk_file in audio_files))
+        if is_cached(audio_file):
+            self.logger.info(f"Using cached audio {audio_file}")
+            return str(audio_file), await self._audio_duration(audio_file, script)
+        
+        tmp_file = audio_file.with_name(temp_name(".mp3"))
+        list_file = self.temp_dir / temp_name(".txt")
+        self._created_files.add(list_file)
+        with open(list_file, "w") as f:
+            for chunk_file in audio_files:
+                escaped = str(chunk_file).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        
+        # All chunks come from the same TTS voice, so the streams can be copied as-is
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", str(list_file),
+            "-c", "copy", str(tmp_file),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise Exception(f"ffmpeg failed to concatenate audio: {stderr.decode(errors='replace')}")
+        os.replace(tmp_file, audio_file)
+        # The chunks are only read again if the same sentence comes back
+        for chunk_file in audio_files:
+            drop_page_cache(chunk_file)
+        
+        self.logger.info(f"Joined {len(audio_files)} audio chunks into {audio_file}")
+        return str(audio_file), await self._audio_duration(audio_file, script)
+    
+    def estimate_duration(self, script):
+        """Estimate how many seconds the narration of `script` lasts from its length."""
+        return len(script) / SPEECH_CHARS_PER_SECOND
+    
+    async def _audio_duration(self, audio_file, script):
+        """Get the duration of an audio file, estimating it from the script if it cannot be read.
+        
+        Durations of cached audio files are stored in a .dur file next to them.
+        """
+        audio_file = Path(audio_file)
+        duration_file = audio_file.with_suffix(".dur") if audio_file.parent == self.cache_dir else None
+        if duration_file and is_cached(duration_file):
+            return float(duration_file.read_text())
+        
+        # Read the duration from the container header with ffprobe
+        try:
+            duration = await probe_duration(audio_file)
+            self.logger.info(f"Audio duration: {duration} seconds")
+            if duration_file:
+                self._write_atomic(duration_file, str(duration).encode())
         except Exception as e:
-            self.logger.error(f"Unexpected error generating TTS: {str(e)}")
-            raise Exception(f"Unexpected error generating TTS: {str(e)}")
+            self.logger.error(f"Error getting audio duration: {str(e)}")
+            # Estimate duration based on script length as fallback
+            duration = self.estimate_duration(script)
+            self.logger.info(f"Estimated audio duration: {duration} seconds (based on text length)")
+        return duration
     
-    async def generate_image(self, content, style):
+    async def generate_image(self, content, style, prompt=None):
         """Generate an image for the video based on content and style, and save to a file.
         
         Args:
             content (str): The topic for the video
             style (str): The style of brainrot content
+            prompt (str, optional): The image prompt. Defaults to a generic prompt about the content.
             
         Returns:
             str: Path to the saved image file
         """
         try:
             self.logger.info(f"Generating image for content: {content}, style: {style}")
-            image_file = self.temp_dir / f"{uuid.uuid4()}.png"
+            if prompt is None:
+                # Generic images are meant to differ between calls, so they are not cached
+                image_file = self.temp_dir / temp_name(".png")
+                self._created_files.add(image_file)
+                prompt = f"Create a captivating image about {content} for tiktok videos. It should look as AI Generated as possible."
+            else:
+                image_file = self.image_cache_path(prompt)
+                if is_cached(image_file):
+                    self.logger.info(f"Using cached image {image_file}")
+                    return str(image_file)
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/image/generate",
-                    headers=self.headers,
-                    json={
-                        "model": "fluently-xl",
-                        "prompt": f"Create a captivating image about {content} for tiktok videos. It should look as AI Generated as possible.",
-                        "height": 512,
-                        "width": 512,
-                        "steps": 20,
-                        "return_binary": False,
-                        "hide_watermark": True,
-                        "format": "png",
-                    }
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-                if "images" not in data or not data["images"]:
-                    raise Exception("No image data in response")
-                
-                # Decode and save image data
-                image_data = base64.b64decode(data["images"][0])
-                with open(image_file, "wb") as f:
-                    f.write(image_data)
-                
-                self.logger.info(f"Image saved to {image_file}")
-                return str(image_file)
+            async with self._stream(
+                "/image/generate",
+                {**self._IMG_BODY_TEMPLATE, "prompt": prompt}
+            ) as response:
+                if response.headers.get("content-type", "").startswith("image/"):
+                    # Stream the PNG straight to disk
+                    tmp_file = image_file.with_name(temp_name(".tmp"))
+                    try:
+                        await self._write_stream(response, tmp_file)
+                        os.replace(tmp_file, image_file)
+                    except BaseException:
+                        # Don't leave a partial download in the cache directory
+                        tmp_file.unlink(missing_ok=True)
+                        raise
+                else:
+                    # API versions without return_binary answer with base64 in JSON
+                    data = orjson.loads(await response.aread())
+                    
+                    if "images" not in data or not data["images"]:
+                        raise Exception("No image data in response")
+                    
+                    # Decode and save image data off the event loop
+                    await asyncio.to_thread(self._decode_and_write, data["images"][0], image_file)
+            
+            self.logger.info(f"Image saved to {image_file}")
+            return str(image_file)
         except httpx.ConnectError as e:
             self.logger.error(f"Connection error to Venice API: {str(e)}")
             raise Exception(f"Failed to connect to Venice API: {str(e)}")
@@ -187,111 +421,64 @@ class VeniceService:
             self.logger.error(f"Unexpected error generating image: {str(e)}")
             raise Exception(f"Unexpected error generating image: {str(e)}")
     
-    async def generate_multiple_images(self, content, style, script, count=5):
-        """Generate multiple images for the video based on content, style and script.
+    def backup_image_prompt(self, content, style, number):
+        """Generic image prompt used when the LLM does not return enough prompts."""
+        return f"Create a captivating image about {content} for {style} style videos, image #{number}"
+    
+    async def generate_image_prompts(self, content, style, script, count=5):
+        """Generate varied image prompts for the video based on content, style and script.
         
         Args:
             content (str): The topic for the video
             style (str): The style of brainrot content
             script (str): The script text to use for generating varied prompts
-            count (int): Number of images to generate
+            count (int): Number of prompts to generate
             
         Returns:
-            list: List of paths to the saved image files
+            list: List of exactly `count` image prompts
         """
+        prompts = []
         try:
-            self.logger.info(f"Generating {count} images for content: {content}, style: {style}")
-            image_files = []
+            self.logger.info(f"Generating {count} image prompts for content: {content}, style: {style}")
             
-            # First, use the LLM to generate different prompts based on the script
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
-                    json={
-                        "model": "llama-3.1-405b",
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "You are an expert at creating diverse image prompts for a video. Generate varied and interesting prompts based on the script."
-                            },
-                            {
-                                "role": "user",
-                                "content": f"Create {count} different image prompts to visualize this script about {content} in {style} style. Script: {script}. Return ONLY a numbered list of prompts."
-                            }
-                        ],
-                        "max_tokens": 500
-                    }
-                )
-                response.raise_for_status()
-                
-                # Extract the generated prompts
-                choices = response.json().get("choices", [])
-                if choices and len(choices) > 0:
-                    prompts_text = choices[0].get("message", {}).get("content", "")
-                    # Parse the numbered list
-                    prompts = []
-                    for line in prompts_text.strip().split("\n"):
-                        if line.strip() and any(line.strip().startswith(str(i) + ".") for i in range(1, count+1)):
-                            prompts.append(line.strip().split(".", 1)[1].strip())
-                    
-                    # If we couldn't parse enough prompts, generate some backup ones
-                    while len(prompts) < count:
-                        prompts.append(f"Create a captivating image about {content} for {style} style videos, image #{len(prompts)+1}")
-                
-                # Generate images for each prompt
-                for i, prompt in enumerate(prompts[:count]):
-                    image_file = self.temp_dir / f"{uuid.uuid4()}.png"
-                    
-                    response = await client.post(
-                        f"{self.base_url}/image/generate",
-                        headers=self.headers,
-                        json={
-                            "model": "fluently-xl",
-                            "prompt": prompt,
-                            "height": 512,
-                            "width": 512,
-                            "steps": 20,
-                            "return_binary": False,
-                            "hide_watermark": True,
-                            "format": "png",
+            # Use the LLM to generate different prompts based on the script
+            response = await self._post(
+                "/chat/completions",
+                {
+                    "model": "llama-3.1-405b",
+                    "messages": [
+                        self._PROMPTS_SYSTEM_MESSAGE,
+                        {
+                            "role": "user",
+                            "content": f"Create {count} different image prompts to visualize this script about {content} in {style} style. Script: {script}. Return ONLY a numbered list of prompts."
                         }
-                    )
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    if "images" not in data or not data["images"]:
-                        continue
-                    
-                    # Decode and save image data
-                    image_data = base64.b64decode(data["images"][0])
-                    with open(image_file, "wb") as f:
-                        f.write(image_data)
-                    
-                    self.logger.info(f"Image {i+1}/{count} saved to {image_file}")
-                    image_files.append(str(image_file))
-                
-                # If we couldn't generate enough images, repeat the original method
-                if len(image_files) < count:
-                    self.logger.warning(f"Could only generate {len(image_files)} images with prompts, using fallback method for remaining images")
-                    remaining = count - len(image_files)
-                    for i in range(remaining):
-                        img_path = await self.generate_image(content, style)
-                        image_files.append(img_path)
-                
-                return image_files
+                    ],
+                    "max_tokens": 500
+                }
+            )
+            
+            # Extract the generated prompts
+            choices = orjson.loads(response.content).get("choices", [])
+            if choices and len(choices) > 0:
+                prompts_text = choices[0].get("message", {}).get("content", "")
+                # Parse the numbered list
+                for line in prompts_text.splitlines():
+                    match = _PROMPT_LINE.match(line)
+                    if match and 1 <= int(match.group(1)) <= count:
+                        prompts.append(match.group(2))
         except Exception as e:
-            self.logger.error(f"Error generating multiple images: {str(e)}")
-            # Fallback to single image generation if there's an error
-            self.logger.info("Falling back to single image generation")
-            img_path = await self.generate_image(content, style)
-            return [img_path]  # Return as a list with a single item
+            self.logger.error(f"Error generating image prompts: {str(e)}")
+        
+        # If we couldn't parse enough prompts, generate some backup ones
+        while len(prompts) < count:
+            prompts.append(self.backup_image_prompt(content, style, len(prompts) + 1))
+        
+        return prompts[:count]
             
-    def cleanup(self):
+    async def cleanup(self):
         """Clean up temporary files created by this service."""
-        for file in self.temp_dir.glob("*"):
-            try:
-                file.unlink()
-            except Exception as e:
-                self.logger.error(f"Error cleaning up file {file}: {str(e)}")
-                pass 
\ No newline at end of file
+        created_files, self._created_files = self._created_files, set()
+        for path, e in await remove_files(created_files):
+            self.logger.error(f"Error cleaning up file {path}: {str(e)}")
+        for path, e in await prune_files(self.cache_dir, DISK_CACHE_MAX_AGE_DAYS * 24 * 60 * 60):
+            self.logger.error(f"Error pruning cache file {path}: {str(e)}") 
\ No newline at end of file
@@ -1,30 +1,164 @@
 import os
 import tempfile
-import uuid
 from pathlib import Path
-import httpx
 import asyncio
 import logging
-import moviepy.editor as mpy
-import moviepy.video.fx.all as vfx
-import numpy as np
 import re
-import json
-import time
-from difflib import SequenceMatcher
-import whisper  # Import the whisper library directly
+import threading
+from functools import lru_cache
+import numpy as np
+import orjson
+from PIL import Image, ImageDraw, ImageFont
+import ctranslate2
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from rapidfuzz import fuzz, process
+from utils.config import DISK_CACHE_MAX_AGE_DAYS, VIDEO_CRF, VIDEO_PRESET, VIDEO_RENDERER, WHISPER_CPU_THREADS, WHISPER_MODEL_SIZE
+from utils.media import h264_encoder, probe_duration
+from utils.paths import file_digest, is_cached, prune_files, remove_files, temp_name
+
+# Output frame rate of the generated videos
+VIDEO_FPS = 24
+
+# Every image segment fades in from and out to black over this many seconds
+FADE_SECONDS = 1
+
+# Caption styling, shared by the ffmpeg (ASS) and MoviePy renderers
+CAPTION_FONT = "Arial"
+CAPTION_FONT_SIZE = 42
+
+# Caption word patterns, compiled once rather than looked up on every word
+_SCRIPT_TOKEN = re.compile(r"[\w']+|[,.!?:;\-]")
+_WORD_GROUP = re.compile(r"^[\w']+[,.!?:;\-]*$")
+_WORD_PARTS = re.compile(r"[\w']+|[^\w\s]")
+_PUNCTUATION = re.compile(r'^[,.!?:;\-]$')
+_NON_WORD_CHARS = re.compile(r'[^\w\']')
+# Braces and backslashes start ASS override tags
+_ASS_SPECIAL = re.compile(r"[{}\\]")
+
+# Number of ~30 second audio chunks Whisper decodes together
+WHISPER_BATCH_SIZE = 8
+
+# Whisper model shared by every VideoService in the process
+_WHISPER_MODEL = None
+_WHISPER_LOCK = threading.Lock()
+
+def _ass_time(seconds):
+    """Format seconds as an ASS timestamp (h:mm:ss.cc)."""
+    centiseconds = int(round(max(0.0, seconds) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+def _video_codec_args(encoder):
+    """ffmpeg video encoding options for the given H.264 encoder."""
+    if encoder == "h264_nvenc":
+        return ["-c:v", encoder, "-preset", "p1", "-rc", "vbr", "-cq", str(VIDEO_CRF)]
+    if encoder == "h264_qsv":
+        return ["-c:v", encoder, "-preset", "veryfast", "-global_quality", str(VIDEO_CRF)]
+    if encoder == "h264_videotoolbox":
+        return ["-c:v", encoder, "-b:v", "4M"]
+    return [
+        "-c:v", encoder,
+        "-preset", VIDEO_PRESET,
+        # Frames only change at fades and caption words, so keep x264 from
+        # spending I-frames on the fades it would detect as scene cuts
+        "-tune", "stillimage",
+        "-x264-params", "scenecut=0",
+        "-crf", str(VIDEO_CRF),
+    ]
+
+def _audio_codec_args(audio_path):
+    """ffmpeg audio encoding options; AAC and MP3 narration is muxed into the MP4 as is."""
+    if Path(audio_path).suffix.lower() in (".aac", ".m4a", ".mp3"):
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", "128k"]
+
+def _similarity_matrix(script_words, transcribed_words):
+    """
+    Score every script word against every transcribed word (0-100).
+
+    Punctuation is ignored, and words of two letters or fewer only score on
+    an exact match.
+    """
+    script_raw = np.array(script_words, dtype=object)[:, None]
+    trans_raw = np.array(transcribed_words, dtype=object)[None, :]
+    script_clean = np.array([_NON_WORD_CHARS.sub('', w) for w in script_words], dtype=object)[:, None]
+    trans_clean = np.array([_NON_WORD_CHARS.sub('', w) for w in transcribed_words], dtype=object)[None, :]
+    scores = process.cdist(script_clean[:, 0], trans_clean[0], scorer=fuzz.ratio, dtype=np.float32)
+
+    script_len = np.vectorize(len, otypes=[int])(script_clean)
+    trans_len = np.vectorize(len, otypes=[int])(trans_clean)
+    short = (script_len <= 2) | (trans_len <= 2)
+    scores[short] = np.where(script_clean == trans_clean, 100, 0)[short]
+    scores[(script_len == 0) | (trans_len == 0)] = 0
+    # Tokens that match before cleaning (e.g. punctuation) always match
+    scores[(script_raw == trans_raw) & (script_raw != "")] = 100
+    return scores
+
+def _whisper_model():
+    """
+    Load the Whisper model on first use and share it across the process.
+    
+    The model is wrapped in a batched pipeline, which splits the audio at
+    speech boundaries and transcribes the chunks as one batch.
+    """
+    global _WHISPER_MODEL
+    with _WHISPER_LOCK:
+        if _WHISPER_MODEL is None:
+            if ctranslate2.get_cuda_device_count() > 0:
+                # FP16 runs on the tensor cores and halves the weight bandwidth
+                model = WhisperModel(WHISPER_MODEL_SIZE, device="cuda", compute_type="float16")
+            else:
+                # CTranslate2 with int8 weights on the CPU
+                model = WhisperModel(WHISPER_MODEL_SIZE, device="cpu", compute_type="int8", cpu_threads=WHISPER_CPU_THREADS)
+            _WHISPER_MODEL = BatchedInferencePipeline(model=model)
+        return _WHISPER_MODEL
+
+@lru_cache(maxsize=1)
+def _caption_font():
+    """Load the caption font, falling back to DejaVu Sans (shipped with fontconfig) and then Pillow's own font."""
+    for font_file in (f"{CAPTION_FONT}.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(font_file, CAPTION_FONT_SIZE)
+        except OSError:
+            continue
+    return ImageFont.load_default(CAPTION_FONT_SIZE)
+
+@lru_cache(maxsize=512)
+def _render_caption_word(word, highlighted):
+    """
+    Rasterize a caption word with Pillow.
+    
+    Returns:
+        numpy.ndarray: RGBA image of the word, white (red when highlighted) with a black outline
+    """
+    font = _caption_font()
+    left, top, right, bottom = font.getbbox(word, stroke_width=2)
+    image = Image.new("RGBA", (max(1, right - left), max(1, bottom - top)), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text(
+        (-left, -top),
+        word,
+        font=font,
+        fill="red" if highlighted else "white",
+        stroke_width=2,
+        stroke_fill="black"
+    )
+    return np.asarray(image)
 
 class VideoService:
     def __init__(self):
         # Create a temp directory for processing
         self.temp_dir = Path(tempfile.gettempdir()) / "brainrotify_video"
         os.makedirs(self.temp_dir, exist_ok=True)
+        # Files written by this service; the temp dir is shared with other workers
+        self._created_files = set()
         self.logger = logging.getLogger(__name__)
         # Pre-load Whisper model if available
         self.whisper_model = None
         try:
             self.logger.info("Loading Whisper model...")
-            self.whisper_model = whisper.load_model("base") # Use base model by default for speed
+            self.whisper_model = _whisper_model()
             self.logger.info("Whisper model loaded successfully")
         except Exception as e:
             self.logger.warning(f"Could not load Whisper model: {str(e)}")
@@ -41,23 +175,58 @@ class VideoService:
         Returns:
             str: Path to the created video file
         """
-        output_file = self.temp_dir / f"{uuid.uuid4()}.mp4"
+        output_file = self.temp_dir / temp_name(".mp4")
+        self._created_files.add(output_file)
         self.logger.info(f"Creating video at {output_file}")
         
+        if VIDEO_RENDERER == "moviepy":
+            return await self._create_video_moviepy(image_paths, audio_path, script, output_file)
+        
         try:
-            # Load audio and get its duration
-            audio = mpy.AudioFileClip(audio_path)
-            duration = audio.duration
+            if not image_paths:
+                raise ValueError("No image paths provided")
+            
+            duration = await probe_duration(audio_path)
             self.logger.info(f"Audio duration: {duration} seconds")
             
+            # Generate caption timings using Whisper for accurate word timestamps
+            self.logger.info("Generating caption timings using Whisper")
+            caption_data = await self._get_whisper_timestamps(audio_path, script, duration)
+            self.logger.info(f"Generated {len(caption_data)} caption segments")
+            
+            self.logger.info("Rendering video file with ffmpeg...")
+            await self._render_ffmpeg(image_paths, audio_path, duration, caption_data, output_file)
+            
+            self.logger.info(f"Video created successfully at {output_file}")
+            return str(output_file)
+        except Exception as e:
+            self.logger.error(f"Error creating video: {str(e)}", exc_info=True)
+            raise Exception(f"Error creating video: {str(e)}")
+    
+    async def _create_video_moviepy(self, image_paths, audio_path, script, output_file):
+        """Create the video with the original MoviePy pipeline (VIDEO_RENDERER=moviepy)."""
+        # MoviePy is only imported when this renderer is used
+        import moviepy.editor as mpy
+        
+        try:
             if not image_paths:
                 raise ValueError("No image paths provided")
             
+            # Transcribe with Whisper for accurate word timestamps while the audio
+            # and all images are decoded; the decoders and Whisper release the GIL
+            self.logger.info("Generating caption timings using Whisper")
+            caption_data, audio, *image_clips = await asyncio.gather(
+                self._get_whisper_timestamps(audio_path, script),
+                asyncio.to_thread(self._load_audio, audio_path),
+                *(asyncio.to_thread(self._load_and_crop, image_path) for image_path in image_paths)
+            )
+            duration = audio.duration
+            self.logger.info(f"Audio duration: {duration} seconds")
+            
             # Create base video clips with images
             if len(image_paths) == 1:
                 # If only one image, use the original method
-                image_clip = mpy.ImageClip(image_paths[0]).set_duration(duration)
-                video = self._crop_to_aspect(image_clip, aspect=9/16)
+                video = image_clips[0].set_duration(duration)
                 video = video.fadein(1).fadeout(1)
             else:
                 # For multiple images, split the duration among them
@@ -65,41 +234,33 @@ class VideoService:
                 segment_duration = duration / len(image_paths)
                 clips = []
                 
-                for i, img_path in enumerate(image_paths):
-                    # Create image clip
-                    img_clip = mpy.ImageClip(img_path).set_duration(segment_duration)
-                    # Crop to correct aspect ratio
-                    img_clip = self._crop_to_aspect(img_clip, aspect=9/16)
-                    
-                    # Add fade effects (except for first and last clip which only need one fade)
-                    if i == 0:
-                        img_clip = img_clip.fadein(1).crossfadeout(1)
-                    elif i == len(image_paths) - 1:
-                        img_clip = img_clip.crossfadein(1).fadeout(1)
-                    else:
-                        img_clip = img_clip.crossfadein(1).crossfadeout(1)
-                    
-                    clips.append(img_clip)
+                for img_clip in image_clips:
+                    # The clips don't overlap, so a crossfade composited over the black
+                    # background is a fade to black; fade the frames directly instead
+                    clips.append(img_clip.set_duration(segment_duration).fadein(1).fadeout(1))
                 
-                # Concatenate all clips
-                video = mpy.concatenate_videoclips(clips, method="compose")
+                # Clips of the same size can be played back to back; only compose
+                # them onto a shared canvas when the crops differ
+                method = "chain" if len({clip.size for clip in clips}) == 1 else "compose"
+                video = mpy.concatenate_videoclips(clips, method=method)
             
-            # Generate caption timings using Whisper for accurate word timestamps
-            self.logger.info("Generating caption timings using Whisper")
-            caption_data = await self._get_whisper_timestamps(audio_path, script)
             self.logger.info(f"Generated {len(caption_data)} caption segments")
             
             # Add captions to the video
-            video = self._add_captions_to_video(video, caption_data, audio)
+            video = await asyncio.to_thread(self._add_captions_to_video, video, caption_data, audio)
             
-            # Write the result to a file
+            # Write the result to a file. MoviePy generates every frame in Python,
+            # so render in a worker thread to keep the event loop responsive.
             self.logger.info("Rendering video file...")
-            video.write_videofile(
+            await asyncio.to_thread(
+                video.write_videofile,
                 str(output_file), 
                 codec='libx264', 
                 audio_codec='aac', 
                 fps=24, 
-                threads=4,
+                threads=0,  # Let ffmpeg size its thread pool to the host
+                preset=VIDEO_PRESET,
+                ffmpeg_params=['-tune', 'stillimage', '-crf', str(VIDEO_CRF), '-movflags', '+faststart'],
                 logger=None  # Suppress MoviePy progress bars
             )
             
@@ -109,7 +270,172 @@ class VideoService:
             self.logger.error(f"Error creating video: {str(e)}", exc_info=True)
             raise Exception(f"Error creating video: {str(e)}")
     
-    async def _get_whisper_timestamps(self, audio_path, script):
+    def _load_audio(self, audio_path):
+        """
+        Decode the narration into memory once (blocking).
+        
+        An AudioFileClip is read through an ffmpeg subprocess that is seeked
+        and re-read while the video is written; an AudioArrayClip serves the
+        samples from memory instead.
+        """
+        import moviepy.editor as mpy
+        from moviepy.audio.AudioClip import AudioArrayClip
+        
+        audio_file = mpy.AudioFileClip(audio_path)
+        try:
+            # AudioFileClip always decodes to stereo, so this is a 2-D (samples, 2) array
+            samples = audio_file.to_soundarray(fps=audio_file.fps)
+        finally:
+            audio_file.close()
+        return AudioArrayClip(samples, fps=audio_file.fps)
+    
+    def _load_and_crop(self, image_path, target_height=1920):
+        """
+        Decode an image into a MoviePy clip cropped to 9:16 (blocking).
+        
+        JPEGs much larger than a target_height tall 9:16 frame are decoded at a
+        reduced scale by libjpeg (for PNGs the draft request is a no-op), and
+        crops taller than target_height are scaled down to it, so MoviePy never
+        blends more pixels per frame than the output needs.
+        """
+        import moviepy.editor as mpy
+        
+        target_width = target_height * 9 // 16
+        with Image.open(image_path) as image:
+            image.draft("RGB", (target_width, target_height))
+            # Crop the decoded image once rather than on every rendered frame
+            new_w, new_h, x, y = self._crop_rect(*image.size)
+            image = image.convert("RGB").crop((x, y, x + new_w, y + new_h))
+        if new_h > target_height:
+            image = image.resize((target_width, target_height), Image.BILINEAR)
+        return mpy.ImageClip(np.asarray(image))
+    
+    async def _render_ffmpeg(self, image_paths, audio_path, duration, caption_data, output_file):
+        """
+        Render the slideshow, captions and audio with a single ffmpeg process.
+        
+        Each image is cropped to 9:16 and shown for an equal share of the audio,
+        fading in from and out to black (which is what the MoviePy crossfades
+        rendered as, since the clips were concatenated without overlap). Captions
+        are burned in from an ASS file by the subtitles filter.
+        
+        Args:
+            image_paths (list): List of paths to the background images
+            audio_path (str): Path to the audio file
+            duration (float): The audio duration in seconds
+            caption_data (list): Caption segments with word timing information
+            output_file (Path): Where to write the video
+        """
+        # Every segment is scaled to the crop of the first image so they can be concatenated
+        width, height = self._crop_rect(*self._image_size(image_paths[0]))[:2]
+        segment_duration = duration / len(image_paths)
+        fade_out_start = max(0.0, segment_duration - FADE_SECONDS)
+        
+        command = ["ffmpeg", "-y", "-loglevel", "error"]
+        filters = []
+        for i, image_path in enumerate(image_paths):
+            command += ["-loop", "1", "-framerate", str(VIDEO_FPS), "-t", f"{segment_duration:.3f}", "-i", str(image_path)]
+            crop_w, crop_h, x, y = self._crop_rect(*self._image_size(image_path))
+            filters.append(
+                f"[{i}:v]crop={crop_w}:{crop_h}:{x}:{y},scale={width}:{height},setsar=1,"
+                f"fade=t=in:st=0:d={FADE_SECONDS},fade=t=out:st={fade_out_start:.3f}:d={FADE_SECONDS}[v{i}]"
+            )
+        command += ["-i", str(audio_path)]
+        
+        filters.append("".join(f"[v{i}]" for i in range(len(image_paths))) + f"concat=n={len(image_paths)}:v=1:a=0[slides]")
+        video_output = "[slides]"
+        if any(segment["words"] for segment in caption_data):
+            ass_file = self._write_ass_captions(caption_data, width, height)
+            # ':' separates filter options, so it has to be escaped in the path
+            ass_path = str(ass_file).replace(":", r"\\:")
+            filters.append(f"[slides]subtitles={ass_path}[captioned]")
+            video_output = "[captioned]"
+        
+        command += [
+            "-filter_complex", ";".join(filters),
+            "-map", video_output,
+            "-map", f"{len(image_paths)}:a",
+            *_video_codec_args(await h264_encoder()),
+            "-pix_fmt", "yuv420p",
+            "-r", str(VIDEO_FPS),
+            *_audio_codec_args(audio_path),
+            # Put the index first so gateways can start playback before the download ends
+            "-movflags", "+faststart",
+            str(output_file)
+        ]
+        
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise Exception(f"ffmpeg failed to render video: {stderr.decode(errors='replace')}")
+    
+    def _image_size(self, image_path):
+        """Read an image's (width, height) from its header without decoding the pixels."""
+        with Image.open(image_path) as image:
+            return image.size
+    
+    def _crop_rect(self, w, h, aspect=9/16):
+        """
+        Compute the centered crop of a w x h frame to the given aspect ratio.
+        
+        Returns:
+            tuple: (width, height, x, y) of the crop, with even dimensions for yuv420p
+        """
+        new_w = int(min(w, aspect * h)) // 2 * 2
+        new_h = int(min(h, w / aspect)) // 2 * 2
+        return new_w, new_h, (w - new_w) // 2, (h - new_h) // 2
+    
+    def _write_ass_captions(self, caption_data, width, height):
+        """
+        Write word captions to an ASS subtitle file for ffmpeg's subtitles filter.
+        
+        Each word is its own event, styled and placed like the MoviePy captions:
+        white (highlighted words red) with a black outline, centered horizontally
+        with its top edge at 85% of the frame height.
+        
+        Returns:
+            Path: The path to the ASS file
+        """
+        ass_file = self.temp_dir / temp_name(".ass")
+        self._created_files.add(ass_file)
+        lines = [
+            "[Script Info]",
+            "ScriptType: v4.00+",
+            f"PlayResX: {width}",
+            f"PlayResY: {height}",
+            "WrapStyle: 2",
+            "",
+            "[V4+ Styles]",
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+            "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+            "Alignment, MarginL, MarginR, MarginV, Encoding",
+            f"Style: Word,{CAPTION_FONT},{CAPTION_FONT_SIZE},&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,"
+            "0,0,0,0,100,100,0,0,1,2,0,8,0,0,0,1",
+            "",
+            "[Events]",
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+        ]
+        # \an8 anchors the word at its top center
+        position = f"{{\\an8\\pos({width // 2},{int(height * 0.85)})}}"
+        for segment in caption_data:
+            for word_info in segment["words"]:
+                word = _ASS_SPECIAL.sub("", word_info["word"]).strip()
+                if not word:
+                    continue
+                color = "{\\c&H0000FF&}" if word_info["highlighted"] else ""
+                lines.append(
+                    f"Dialogue: 0,{_ass_time(word_info['start'])},{_ass_time(word_info['end'])},Word,,0,0,0,,{position}{color}{word}"
+                )
+        
+        with open(ass_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return ass_file
+    
+    async def _get_whisper_timestamps(self, audio_path, script, duration=None):
         """
         Use Whisper to transcribe the audio and get accurate word timestamps,
         then align with the script using fuzzy matching.
@@ -117,6 +443,8 @@ class VideoService:
         Args:
             audio_path (str): Path to the audio file
             script (str): The reference script
+            duration (float, optional): The audio duration, if already known;
+                only the estimation fallback needs it, and probes for it otherwise
             
         Returns:
             list: Caption data with accurate word timing
@@ -131,11 +459,15 @@ class VideoService:
                 self.logger.warning(f"Error using Whisper library: {str(e)}, falling back to estimate")
             
             # If Whisper fails, fall back to the estimation method
-            return self._generate_caption_timings(script, mpy.AudioFileClip(audio_path).duration)
+            if duration is None:
+                duration = await probe_duration(audio_path)
+            return self._generate_caption_timings(script, duration)
         except Exception as e:
             self.logger.error(f"Error getting Whisper timestamps: {str(e)}")
             # Fall back to estimation if all else fails
-            return self._generate_caption_timings(script, mpy.AudioFileClip(audio_path).duration)
+            if duration is None:
+                duration = await probe_duration(audio_path)
+            return self._generate_caption_timings(script, duration)
     
     async def _whisper_transcribe_python(self, audio_path):
         """
@@ -148,46 +480,62 @@ class VideoService:
             list: Word-level transcription data
         """
         try:
+            # Transcripts are cached by audio content, so the same narration is only transcribed once
+            # The key covers the audio content and the Whisper model
+            cache_file = self.temp_dir / f"{await asyncio.to_thread(file_digest, audio_path, WHISPER_MODEL_SIZE)}.whisper.json"
+            if is_cached(cache_file):
+                self.logger.info(f"Using cached transcription {cache_file}")
+                return orjson.loads(await asyncio.to_thread(cache_file.read_bytes))
+            
             # If model isn't loaded yet, load it now
             if self.whisper_model is None:
                 self.logger.info("Loading Whisper model on demand...")
-                self.whisper_model = whisper.load_model("tiny")
+                self.whisper_model = _whisper_model()
             
             # Run transcription in a thread pool to avoid blocking
             self.logger.info(f"Transcribing audio file {audio_path}")
             
-            # Use run_in_executor to run CPU-intensive task in a thread pool
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,  # Use default executor
-                lambda: self.whisper_model.transcribe(
+            def transcribe():
+                segments, _ = self.whisper_model.transcribe(
                     audio_path,
                     language="en",
-                    word_timestamps=True
+                    word_timestamps=True,
+                    vad_filter=True,
+                    batch_size=WHISPER_BATCH_SIZE
                 )
-            )
+                # segments is lazy; the audio is decoded while iterating it
+                return [word for segment in segments for word in segment.words or []]
+            
+            # Use run_in_executor to run CPU-intensive task in a thread pool
+            loop = asyncio.get_event_loop()
+            words = await loop.run_in_executor(None, transcribe)
             
             self.logger.info("Transcription complete")
             
             # Extract word timings from segments
-            words_with_timing = []
-            
-            for segment in result.get('segments', []):
-                for word_info in segment.get('words', []):
-                    # The format might be slightly different from the CLI output
-                    words_with_timing.append({
-                        'word': word_info.get('word', '').strip(),
-                        'start': word_info.get('start', 0),
-                        'end': word_info.get('end', 0),
-                        'highlighted': False  # Will be set during alignment
-                    })
+            words_with_timing = [
+                {
+                    'word': word.word.strip(),
+                    'start': word.start,
+                    'end': word.end,
+                    'highlighted': False  # Will be set during alignment
+                }
+                for word in words
+            ]
             
             self.logger.info(f"Extracted {len(words_with_timing)} words with timestamps")
+            await asyncio.to_thread(self._write_transcript, cache_file, words_with_timing)
             return words_with_timing
         except Exception as e:
             self.logger.error(f"Error in Python Whisper transcription: {str(e)}")
             raise
     
+    def _write_transcript(self, cache_file, words_with_timing):
+        """Write a transcript to the cache so that concurrent readers never see it half-written."""
+        tmp_file = cache_file.with_name(temp_name(".tmp"))
+        tmp_file.write_bytes(orjson.dumps(words_with_timing))
+        os.replace(tmp_file, cache_file)
+    
     def _align_transcription_with_script(self, whisper_words, script):
         """
         Align the Whisper transcription with the original script using fuzzy matching.
@@ -200,7 +548,7 @@ class VideoService:
             list: Caption data with aligned word timing
         """
         # Clean up the script and split into words
-        script_words = re.findall(r"[\w']+|[,.!?:;\-]", script.lower())
+        script_words = _SCRIPT_TOKEN.findall(script.lower())
         
         # Get just the words from whisper
         transcribed_words = [w['word'].lower() for w in whisper_words]
@@ -208,6 +556,9 @@ class VideoService:
         # Keep track of matches for debugging
         self.logger.info(f"Script words: {len(script_words)}, Transcribed words: {len(whisper_words)}")
         
+        # Score every script word against every transcribed word up front
+        scores = _similarity_matrix(script_words, transcribed_words)
+        
         # Initialize aligned words list
         aligned_words = []
         
@@ -218,20 +569,11 @@ class VideoService:
         while script_idx < len(script_words) and trans_idx < len(whisper_words):
             script_word = script_words[script_idx]
             
-            # Try to find a good match within the next few transcribed words
+            # Take the best match within the next few transcribed words
+            window = scores[script_idx, trans_idx:trans_idx + 10]
             best_match_idx = None
-            best_match_score = 0
-            
-            for look_ahead in range(min(10, len(whisper_words) - trans_idx)):
-                match_idx = trans_idx + look_ahead
-                trans_word = transcribed_words[match_idx]
-                
-                # Calculate similarity score
-                similarity = self._word_similarity(script_word, trans_word)
-                
-                if similarity > best_match_score and similarity > 0.6:  # 60% similarity threshold
-                    best_match_score = similarity
-                    best_match_idx = match_idx
+            if window.size and window.max() > 60:  # 60% similarity threshold
+                best_match_idx = trans_idx + int(window.argmax())
             
             if best_match_idx is not None:
                 # Use timing from the matched transcribed word
@@ -240,7 +582,7 @@ class VideoService:
                     'word': script_word,
                     'start': timing['start'],
                     'end': timing['end'],
-                    'highlighted': (script_idx % 4 == 0) and not re.match(r'^[,.!?:;\-]$', script_word)
+                    'highlighted': (script_idx % 4 == 0) and not _PUNCTUATION.match(script_word)
                 })
                 
                 # Advance indices
@@ -257,7 +599,7 @@ class VideoService:
                         'word': script_word,
                         'start': timing['start'],
                         'end': timing['start'] + word_duration,
-                        'highlighted': (script_idx % 4 == 0) and not re.match(r'^[,.!?:;\-]$', script_word)
+                        'highlighted': (script_idx % 4 == 0) and not _PUNCTUATION.match(script_word)
                     })
                 script_idx += 1
                 # Don't advance trans_idx to try matching the next script word
@@ -280,68 +622,6 @@ class VideoService:
                 audio_duration = whisper_words[-1]['end'] if whisper_words else 60
             return self._generate_caption_timings(script, audio_duration)
     
-    def _word_similarity(self, word1, word2):
-        """
-        Calculate similarity between two words using sequence matcher.
-        
-        Args:
-            word1 (str): First word
-            word2 (str): Second word
-            
-        Returns:
-            float: Similarity score between 0 and 1
-        """
-        if not word1 or not word2:
-            return 0
-        
-        # Exact match
-        if word1 == word2:
-            return 1.0
-            
-        # Clean up words (remove punctuation)
-        word1 = re.sub(r'[^\w\']', '', word1.lower())
-        word2 = re.sub(r'[^\w\']', '', word2.lower())
-        
-        if not word1 or not word2:
-            return 0
-            
-        # For very short words, require exact match
-        if len(word1) <= 2 or len(word2) <= 2:
-            return 1.0 if word1 == word2 else 0.0
-            
-        # Use sequence matcher for longer words
-        return SequenceMatcher(None, word1, word2).ratio()
-    
-    def _crop_to_aspect(self, video, aspect=9/16, overflow=False):
-        """
-        Crop a video to the specified aspect ratio.
-        
-        Args:
-            video (VideoClip): The video to crop
-            aspect (float): The desired aspect ratio
-            overflow (bool): Whether to allow overflow
-            
-        Returns:
-            VideoClip: The cropped video
-        """
-        (w, h) = video.size
-        if overflow:
-            # Resize without using the problematic PIL.Image.ANTIALIAS
-            # Just use the original size
-            pass
-            
-        new_w = int(min(w, aspect * h))
-        new_h = int(min(h, w / aspect))
-
-        cropped = vfx.crop(
-            video, 
-            width=new_w, 
-            height=new_h, 
-            x_center=int(w / 2), 
-            y_center=int(h / 2)
-        )
-        return cropped
-    
     def _generate_caption_timings(self, script, duration):
         """
         Generate caption timings for the script.
@@ -365,69 +645,54 @@ class VideoService:
             word_groups = script.strip().split()
             for group in word_groups:
                 # Check if this is a single word (possibly with apostrophe) or multiple words with punctuation
-                if re.match(r"^[\w']+[,.!?:;\-]*$", group):
+                if _WORD_GROUP.match(group):
                     # It's a single word (possibly with trailing punctuation)
                     words.append(group)
                 else:
                     # It might contain multiple words or special characters
                     # Split while preserving apostrophes within words
-                    parts = re.findall(r"[\w']+|[^\w\s]", group)
+                    parts = _WORD_PARTS.findall(group)
                     words.extend(parts)
             
             if not words:
                 return []
             
-            # Calculate average word duration, with special handling for punctuation
-            # Count special characters as shorter
-            total_word_weights = 0
-            for word in words:
-                if re.match(r'^[,.!?:;\-]$', word):  # Single punctuation
-                    total_word_weights += 0.5  # Punctuation counts as half a word
-                else:
-                    # Words are weighted by their length
-                    word_len = len(word)
-                    if word_len <= 2:  # Very short words
-                        total_word_weights += 0.7
-                    elif word_len <= 4:  # Short words
-                        total_word_weights += 0.9
-                    else:  # Normal and long words
-                        total_word_weights += 1.0 + min(0.5, (word_len - 5) * 0.1)  # Add small weight for longer words
+            # Weight every word at once: punctuation counts as half a word and
+            # words are weighted by their length
+            lens = np.fromiter((len(word) for word in words), dtype=np.int32, count=len(words))
+            is_punctuation = np.fromiter((_PUNCTUATION.match(word) is not None for word in words), dtype=bool, count=len(words))
+            weights = np.where(
+                is_punctuation, 0.5,
+                np.where(lens <= 2, 0.7,  # Very short words
+                np.where(lens <= 4, 0.9,  # Short words
+                1.0 + np.minimum(0.5, (lens - 5) * 0.1)))  # Add small weight for longer words
+            )
             
             # Calculate base word duration
+            total_word_weights = weights.sum()
             base_word_duration = duration / total_word_weights if total_word_weights > 0 else 0.3
             
+            # Give extra pause after end of sentence punctuation (not counted in the total)
+            sentence_end = np.fromiter((word in ".!?" for word in words), dtype=bool, count=len(words))
+            durations = np.where(is_punctuation & sentence_end, 0.8, weights) * base_word_duration
+            ends = np.cumsum(durations)
+            starts = ends - durations
+            
+            # Every 4th word is highlighted (except punctuation)
+            highlighted = (np.arange(len(words)) % 4 == 0) & ~is_punctuation
+            
             # Prepare the words with timing
-            words_meta = []
-            current_time = 0
-            
-            for i, word in enumerate(words):
-                # Set dynamic word duration based on word characteristics
-                if re.match(r'^[,.!?:;\-]$', word):  # Single punctuation
-                    word_duration = base_word_duration * 0.5
-                    # Give extra pause after end of sentence punctuation
-                    if word in ".!?":
-                        word_duration = base_word_duration * 0.8
-                else:
-                    # Words are timed by their length
-                    word_len = len(word)
-                    if word_len <= 2:  # Very short words
-                        word_duration = base_word_duration * 0.7
-                    elif word_len <= 4:  # Short words
-                        word_duration = base_word_duration * 0.9
-                    else:  # Normal and long words
-                        word_duration = base_word_duration * (1.0 + min(0.5, (word_len - 5) * 0.1))
-                
-                # Every 4th word is highlighted (except punctuation)
-                highlighted = (i % 4 == 0) and not re.match(r'^[,.!?:;\-]$', word)
-                
-                words_meta.append({
+            words_meta = [
+                {
                     "word": word,
-                    "start": current_time,
-                    "end": current_time + word_duration,
-                    "highlighted": highlighted
-                })
-                
-                current_time += word_duration
+                    "start": start,
+                    "end": end,
+                    "highlighted": highlight
+                }
+                for word, start, end, highlight in zip(
+                    words, starts.tolist(), ends.tolist(), highlighted.tolist()
+                )
+            ]
             
             # Package it as a single caption segment
             caption_data = [{
@@ -453,6 +718,8 @@ class VideoService:
         Returns:
             VideoClip: The video with captions added
         """
+        import moviepy.editor as mpy
+        
         try:
             if not caption_data:
                 video.audio = audio
@@ -460,77 +727,68 @@ class VideoService:
                 
             self.logger.info("Adding captions to video")
             
-            # Set up font and sizing
-            font = "Arial"  # Default font, would be better to check if available
-            font_size = 42  # Increased size for better readability
-            
             # Get video dimensions
             screensize = video.size
             total_h = screensize[1]
             total_w = screensize[0]
             
-            # Extract all words with absolute timing
-            all_words = []
-            for segment in caption_data:
-                for word_detail in segment["words"]:
-                    all_words.append({
-                        "word": word_detail["word"],
-                        "start": word_detail["start"],
-                        "end": word_detail["end"],
-                        "highlighted": word_detail["highlighted"]
-                    })
+            # Collect the words in start order; only one is on screen at a time
+            words = sorted(
+                (
+                    (word_info["start"], word_info["end"], word_info["word"], word_info["highlighted"])
+                    for segment in caption_data
+                    for word_info in segment["words"]
+                    # Skip empty words
+                    if word_info["word"].strip()
+                ),
+                key=lambda w: w[0]
+            )
             
-            # Create clips for each word
-            text_clips = []
+            if not words:
+                # If no words to show, return original video with audio
+                video.audio = audio
+                return video
             
-            for word_info in all_words:
-                word = word_info["word"]
-                word_start = word_info["start"]
-                word_end = word_info["end"]
-                highlighted = word_info["highlighted"]
-                
-                # Skip empty words
-                if not word.strip():
-                    continue
-                
-                # Create text clip for this word (with built-in shadow effect)
-                word_clip = mpy.TextClip(
-                    word,
-                    fontsize=font_size,
-                    font=font,
-                    color="red" if highlighted else "white",
-                    stroke_width=2,
-                    stroke_color="black",
-                    method='caption'
-                )
-                
-                # Position word at center bottom
-                word_w, word_h = word_clip.size
-                position_x = total_w // 2 - word_w // 2
-                position_y = int(total_h * 0.85)  # Lower on screen (85% of height)
-                
-                # Add word clip with precise timing
-                text_clips.append((word_clip
-                    .set_position((position_x, position_y))
-                    .set_start(word_start)
-                    .set_end(word_end)))
+            # Rasterize each distinct word once onto a full-width strip, centered
+            layers = {}
+            for _, _, word, highlighted in words:
+                if (word, highlighted) not in layers:
+                    layers[(word, highlighted)] = _render_caption_word(word, highlighted)
+            strip_h = max(sprite.shape[0] for sprite in layers.values())
+            for key, sprite in layers.items():
+                sprite = sprite[:, max(0, (sprite.shape[1] - total_w) // 2):][:, :total_w]
+                strip = np.zeros((strip_h, total_w, 4), dtype=np.uint8)
+                x = (total_w - sprite.shape[1]) // 2
+                strip[:sprite.shape[0], x:x + sprite.shape[1]] = sprite
+                layers[key] = (strip[:, :, :3], strip[:, :, 3] / 255.0)
+            
+            starts = np.array([w[0] for w in words])
+            blank = (np.zeros((strip_h, total_w, 3), dtype=np.uint8), np.zeros((strip_h, total_w)))
+            
+            def active_layer(t):
+                # Latest word that has started and not yet ended
+                i = np.searchsorted(starts, t, side="right") - 1
+                if i >= 0 and t < words[i][1]:
+                    return layers[(words[i][2], words[i][3])]
+                return blank
+            
+            # One caption layer (with its alpha as mask) instead of a clip per word
+            caption_mask = mpy.VideoClip(lambda t: active_layer(t)[1], ismask=True, duration=video.duration)
+            caption_clip = (mpy.VideoClip(lambda t: active_layer(t)[0], duration=video.duration)
+                .set_mask(caption_mask)
+                # Lower on screen (85% of height)
+                .set_position((0, int(total_h * 0.85))))
             
-            # Create final video with all clips
             # Make sure the final video has the original duration
-            if text_clips:
-                result = mpy.CompositeVideoClip(
-                    [video] + text_clips,
-                    size=video.size
-                ).set_duration(video.duration)
-                
-                # Set audio properly
-                result.audio = audio
-                
-                return result
-            else:
-                # If no text clips created, return original video with audio
-                video.audio = audio
-                return video
+            result = mpy.CompositeVideoClip(
+                [video, caption_clip],
+                size=video.size
+            ).set_duration(video.duration)
+            
+            # Set audio properly
+            result.audio = audio
+            
+            return result
                 
         except Exception as e:
             self.logger.error(f"Error adding captions to video: {str(e)}")
@@ -539,11 +797,11 @@ class VideoService:
             return video
     
     async def cleanup(self):
-        """Clean up temporary files."""
+        """Clean up temporary files created by this service."""
         self.logger.info("Cleaning up temporary files in video service")
-        for file in self.temp_dir.glob("*"):
-            try:
-                file.unlink()
-            except Exception as e:
-                self.logger.error(f"Error cleaning up file {file}: {str(e)}")
-                pass 
\ No newline at end of file
+        created_files, self._created_files = self._created_files, set()
+        for path, e in await remove_files(created_files):
+            self.logger.error(f"Error cleaning up file {path}: {str(e)}")
+        # Cached transcripts are kept across jobs until they go unused for a while
+        for path, e in await prune_files(self.temp_dir, DISK_CACHE_MAX_AGE_DAYS * 24 * 60 * 60, "*.whisper.json"):
+            self.logger.error(f"Error pruning cached transcript {path}: {str(e)}")
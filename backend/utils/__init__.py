@@ -1,3 +1,6 @@
-from .config import VENICE_API_KEY
+from .config import VENICE_API_KEY, REDIS_URL, WORKER_CONCURRENCY, VIDEO_RENDERER, VIDEO_PRESET, VIDEO_CRF, VIDEO_ENCODER, WHISPER_MODEL_SIZE, WHISPER_CPU_THREADS, DISK_CACHE_MAX_AGE_DAYS
+from .media import h264_encoder, probe_duration
+from .paths import drop_page_cache, file_digest, is_cached, prune_files, remove_files, temp_name
+from .retry import retry_delay
 
-__all__ = ["VENICE_API_KEY"] 
\ No newline at end of file
+__all__ = ["VENICE_API_KEY", "REDIS_URL", "WORKER_CONCURRENCY", "VIDEO_RENDERER", "VIDEO_PRESET", "VIDEO_CRF", "VIDEO_ENCODER", "WHISPER_MODEL_SIZE", "WHISPER_CPU_THREADS", "DISK_CACHE_MAX_AGE_DAYS", "h264_encoder", "probe_duration", "drop_page_cache", "file_digest", "is_cached", "prune_files", "remove_files", "temp_name", "retry_delay"] 
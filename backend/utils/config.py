@@ -6,4 +6,35 @@ load_dotenv()
 VENICE_API_KEY = os.getenv("VENICE_KEY")
 
 if not VENICE_API_KEY:
-    raise ValueError("VENICE_KEY environment variable is not set") 
\ No newline at end of file
+    raise ValueError("VENICE_KEY environment variable is not set")
+
+# Redis is used both as the Celery broker and as the result backend
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Celery worker processes per host (Celery's own default is one per core)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", str(os.cpu_count() or 1)))
+
+# Videos are rendered by a single ffmpeg process; set to "moviepy" to use the
+# original MoviePy pipeline instead
+VIDEO_RENDERER = os.getenv("VIDEO_RENDERER", "ffmpeg")
+
+# x264 preset and constant rate factor for the rendered videos; faster presets
+# and higher CRFs trade quality for render time and file size
+VIDEO_PRESET = os.getenv("VIDEO_PRESET", "veryfast")
+VIDEO_CRF = int(os.getenv("VIDEO_CRF", "23"))
+
+# H.264 encoder for the ffmpeg renderer: "auto" uses a working hardware encoder
+# (NVENC, Quick Sync, VideoToolbox) when there is one, otherwise libx264
+VIDEO_ENCODER = os.getenv("VIDEO_ENCODER", "auto")
+
+# Whisper model used for caption timestamps ("tiny" is faster, "small" and up
+# are more accurate); it runs on the GPU in FP16 when CUDA is available
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base")
+
+# CPU threads each worker process gives Whisper; by default the cores are
+# split between the worker processes so they don't oversubscribe the host
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", str(max(1, (os.cpu_count() or 1) // WORKER_CONCURRENCY))))
+
+# Files in the on-disk caches (TTS audio, images, transcripts) that haven't
+# been used for this many days are deleted, like the week-long Redis TTL
+DISK_CACHE_MAX_AGE_DAYS = float(os.getenv("DISK_CACHE_MAX_AGE_DAYS", "7"))
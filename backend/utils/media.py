@@ -0,0 +1,66 @@
+import asyncio
+from utils.config import VIDEO_ENCODER
+
+# Hardware H.264 encoders to try, in order of preference
+HARDWARE_H264_ENCODERS = ("h264_nvenc", "h264_qsv", "h264_videotoolbox")
+
+_h264_encoder = None
+
+
+async def probe_duration(path):
+    """Read the duration of a media file from its container header with ffprobe.
+    
+    Args:
+        path (str): Path to the audio or video file
+        
+    Returns:
+        float: Duration in seconds
+    """
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        str(path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}: {stderr.decode(errors='replace').strip()}")
+    return float(stdout.strip())
+
+
+async def _encoder_works(encoder):
+    """Check that ffmpeg can actually encode with `encoder` on this host."""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-v", "error",
+        "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1",
+        "-c:v", encoder, "-f", "null", "-",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    return await process.wait() == 0
+
+
+async def h264_encoder():
+    """Pick the H.264 encoder to render videos with.
+    
+    VIDEO_ENCODER can name an encoder explicitly. With "auto", each hardware
+    encoder is tried with a tiny test encode (ffmpeg lists e.g. h264_nvenc even
+    on hosts without a GPU), falling back to libx264. The choice is made once
+    per process.
+    
+    Returns:
+        str: The ffmpeg encoder name
+    """
+    global _h264_encoder
+    if _h264_encoder is None:
+        encoder = VIDEO_ENCODER
+        if encoder == "auto":
+            encoder = "libx264"
+            for candidate in HARDWARE_H264_ENCODERS:
+                if await _encoder_works(candidate):
+                    encoder = candidate
+                    break
+        _h264_encoder = encoder
+    return _h264_encoder
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import itertools
+import os
+import time
+from pathlib import Path
+
+# Read size when hashing files on Python versions without hashlib.file_digest
+HASH_CHUNK_SIZE = 1 << 20
+
+# Process-local counter for temp file names. Together with the pid and the
+# current time it is unique without reading the kernel RNG like uuid4 does.
+_counter = itertools.count()
+
+
+def temp_name(suffix=""):
+    """Return a unique file name for a temporary artifact.
+    
+    Args:
+        suffix (str, optional): File extension, including the dot
+        
+    Returns:
+        str: The file name
+    """
+    # The pid is read on every call so forked worker processes never collide
+    return f"{os.getpid()}_{time.time_ns()}_{next(_counter)}{suffix}"
+
+
+def file_digest(path, *salt):
+    """Return a hex blake2b digest of a file's content, mixed with optional salt strings.
+    
+    Blocking: hashing reads the whole file, so call it from a worker thread.
+    
+    Args:
+        path (str): Path to the file
+        *salt (str): Strings hashed ahead of the content, e.g. the settings the result depends on
+        
+    Returns:
+        str: The 32 character hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if salt:
+        digest.update("|".join(salt).encode())
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            # Python 3.11+: the read/hash loop runs in C without the GIL
+            return hashlib.file_digest(f, lambda: digest).hexdigest()
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def drop_page_cache(path):
+    """Ask the kernel to evict a file's pages from the page cache.
+    
+    For large files that are read once and then kept on disk (rendered
+    videos, TTS chunks), so they don't push hotter data out of memory.
+    A no-op on platforms without posix_fadvise.
+    
+    Args:
+        path (str): Path to the file
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+async def remove_files(paths):
+    """Delete files concurrently.
+    
+    Args:
+        paths (iterable): Paths of the files to delete; files that are already gone are skipped
+        
+    Returns:
+        list: (path, OSError) for every file that could not be removed
+    """
+    paths = list(paths)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(os.unlink, path) for path in paths),
+        return_exceptions=True
+    )
+    return [
+        (path, result) for path, result in zip(paths, results)
+        if isinstance(result, OSError) and not isinstance(result, FileNotFoundError)
+    ]
+
+
+def is_cached(path):
+    """Check for a cache file, marking it as recently used when it exists.
+    
+    prune_files expires cache files by modification time, so touching them on
+    every hit keeps entries that are still in use from being pruned.
+    
+    Args:
+        path (str): Path to the cache file
+        
+    Returns:
+        bool: Whether the file exists
+    """
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _expired_files(directory, pattern, max_age_seconds):
+    """List the files in `directory` matching `pattern` that were last modified too long ago."""
+    cutoff = time.time() - max_age_seconds
+    expired = []
+    for path in Path(directory).glob(pattern):
+        try:
+            if path.stat().st_mtime < cutoff:
+                expired.append(path)
+        except FileNotFoundError:
+            continue
+    return expired
+
+
+async def prune_files(directory, max_age_seconds, pattern="*"):
+    """Delete the files in a cache directory that have not been used for a while.
+    
+    Args:
+        directory (str): The cache directory
+        max_age_seconds (float): Files last modified longer ago than this are deleted
+        pattern (str, optional): Glob pattern selecting the cache files
+        
+    Returns:
+        list: (path, OSError) for every file that could not be removed
+    """
+    return await remove_files(await asyncio.to_thread(_expired_files, directory, pattern, max_age_seconds))
@@ -0,0 +1,31 @@
+import random
+
+
+def retry_delay(response, attempt, backoff_min, backoff_max, jitter=False):
+    """Seconds to wait before re-sending an HTTP request.
+    
+    Exponential backoff from `backoff_min`, honouring Retry-After on 429. The
+    delay never exceeds `backoff_max`, even when Retry-After asks for longer,
+    so a rate-limited upstream can't hold a worker for an hour.
+    
+    Args:
+        response (httpx.Response): The failed response, or None after a timeout
+        attempt (int): Zero-based number of the attempt that failed
+        backoff_min (float): Delay after the first attempt, in seconds
+        backoff_max (float): Upper bound on the delay, in seconds
+        jitter (bool, optional): Pick the backoff uniformly between 0 and its
+            exponential value, so concurrent requests don't retry in lockstep
+        
+    Returns:
+        float: The delay in seconds
+    """
+    backoff = min(backoff_max, backoff_min * 2 ** attempt)
+    if jitter:
+        backoff = random.uniform(0, backoff)
+    if response is not None and response.status_code == 429:
+        try:
+            return min(backoff_max, max(0.0, float(response.headers.get("Retry-After", backoff))))
+        except ValueError:
+            # Retry-After given as an HTTP date
+            return backoff
+    return backoff
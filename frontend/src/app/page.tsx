@@ -29,6 +29,32 @@ const ShootingStars = () => {
     );
 };
 
+const API_URL = "http://localhost:8000";
+const POLL_INTERVAL_MS = 3000;
+// Give up on a job that hasn't finished in this long
+const POLL_TIMEOUT_MS = 15 * 60 * 1000;
+
+// Poll a queued generation job until it finishes and return its result
+async function waitForGeneration(jobId: string) {
+    const deadline = Date.now() + POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+        const resp = await fetch(`${API_URL}/generate/${jobId}`);
+        if (!resp.ok) {
+            throw new Error(`Checking generation status failed: ${resp.status}`);
+        }
+        const status = await resp.json();
+        if (status.state === "SUCCESS") {
+            return status.result;
+        }
+        if (status.state === "FAILURE") {
+            throw new Error(status.error || "Generation failed");
+        }
+        console.log("generation", status.state, status.step);
+        await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+    }
+    throw new Error("Generation timed out");
+}
+
 export default function Home() {
     const [style, setStyle] = useState("");
     const [content, setContent] = useState("");
@@ -67,7 +93,7 @@ export default function Home() {
     const { writeContract, isSuccess, isError, error } = useWriteContract();
     async function createMyCoin() {
         try {
-            const resp = await fetch("http://localhost:8000/generate", {
+            const resp = await fetch(`${API_URL}/generate`, {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
@@ -79,7 +105,14 @@ export default function Home() {
                     description: description,
                 }),
             });
-            const data = await resp.json();
+            if (!resp.ok) {
+                throw new Error(`Generation request failed: ${resp.status} ${await resp.text()}`);
+            }
+            const { job_id } = await resp.json();
+            if (!job_id) {
+                throw new Error("Generation request returned no job id");
+            }
+            const data = await waitForGeneration(job_id);
             const metadataUri =
                 data.metadata_uri ||
                 "ipfs://bafybeigoxzqzbnxsn35vq7lls3ljxdcwjafxvbvkivprsodzrptpiguysy";